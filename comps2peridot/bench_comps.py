@@ -0,0 +1,175 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+import argparse
+import os
+import tempfile
+import time
+
+# noinspection PyPep8Naming
+import xml.etree.ElementTree as ET
+
+from comps2peridot import variant_jobs, write_variant
+
+# Compares the category group filtering of write_variant, a set of the
+# variant's group ids, with the nested scans over the variant's groups it
+# replaced, on a synthetic comps file
+
+ARCHES = ["x86_64", "aarch64", "ppc64le", "s390x"]
+LANGS = ["", "de", "fr", "ja", "zh_CN"]
+
+
+def add_names(elem, text):
+    for tag in ["name", "description"]:
+        for lang in LANGS:
+            child = ET.SubElement(elem, tag)
+            if lang:
+                child.set("xml:lang", lang)
+            child.text = f"{text} {tag} {lang}"
+
+
+def make_comps(n_groups, n_environments, n_categories, n_packages):
+    root = ET.Element("comps")
+    for i in range(n_groups):
+        group = ET.SubElement(root, "group")
+        # Some groups only exist on a few arches
+        if i % 7 == 0:
+            group.set("arch", "x86_64,aarch64")
+        ET.SubElement(group, "id").text = f"group{i}"
+        add_names(group, f"Group {i}")
+        ET.SubElement(group, "default").text = "true" if i % 2 else "false"
+        ET.SubElement(group, "uservisible").text = "true"
+        package_list = ET.SubElement(group, "packagelist")
+        for j in range(n_packages):
+            req = ET.SubElement(package_list, "packagereq", type="default")
+            req.text = f"pkg{i}-{j}"
+    for tag, n, lists in [
+        ("environment", n_environments, ["grouplist", "optionlist"]),
+        ("category", n_categories, ["grouplist"]),
+    ]:
+        for i in range(n):
+            elem = ET.SubElement(root, tag)
+            ET.SubElement(elem, "id").text = f"{tag}{i}"
+            add_names(elem, f"{tag} {i}")
+            ET.SubElement(elem, "display_order").text = str(i)
+            for list_tag in lists:
+                group_list = ET.SubElement(elem, list_tag)
+                # Every group is in some list, like in a full comps file
+                for j in range(i, n_groups, n):
+                    ET.SubElement(group_list, "groupid").text = f"group{j}"
+    return root
+
+
+def make_variants(n_variants, n_groups, n_environments):
+    root = ET.Element("variants")
+    for i in range(n_variants):
+        variant = ET.SubElement(
+            root, "variant", id=f"Repo{i}", name=f"Repo{i}", type="variant"
+        )
+        arches = ET.SubElement(variant, "arches")
+        for arch in ARCHES:
+            ET.SubElement(arches, "arch").text = arch
+        groups = ET.SubElement(variant, "groups")
+        for j in range(i, n_groups, n_variants):
+            ET.SubElement(groups, "group").text = f"group{j}"
+        environments = ET.SubElement(variant, "environments")
+        for j in range(n_environments):
+            ET.SubElement(environments, "environment").text = f"environment{j}"
+    return root
+
+
+def scan_categories(groups, categories):
+    # The category filtering as write_variant did it before
+    ret = {}
+    for category_name in categories.keys():
+        category = categories[category_name]
+        new_group_list = []
+        for group in category.group_list:
+            for ggroup in groups:
+                if ggroup.id == group.name:
+                    new_group_list.append(group)
+                    break
+        ret[category_name] = new_group_list
+    return ret
+
+
+def index_categories(groups, categories):
+    group_ids = {group.id for group in groups}
+    return {
+        category_name: [
+            group for group in category.group_list if group.name in group_ids
+        ]
+        for category_name, category in categories.items()
+    }
+
+
+def bench(name, func, jobs, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ret = [func(groups, categories) for groups, _, categories, _ in jobs]
+    print(f"{name}: {(time.perf_counter() - start) / repeat * 1000:.2f}ms")
+    return ret
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark comps category filtering."
+    )
+    parser.add_argument("--groups", type=int, default=300)
+    parser.add_argument("--environments", type=int, default=20)
+    parser.add_argument("--categories", type=int, default=40)
+    parser.add_argument("--packages", type=int, default=20)
+    parser.add_argument("--variants", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        comps_path = os.path.join(tmp, "comps.xml")
+        variants_path = os.path.join(tmp, "variants.xml")
+        ET.ElementTree(
+            make_comps(args.groups, args.environments, args.categories, args.packages)
+        ).write(comps_path, encoding="utf-8", xml_declaration=True)
+        ET.ElementTree(
+            make_variants(args.variants, args.groups, args.environments)
+        ).write(variants_path, encoding="utf-8", xml_declaration=True)
+
+        jobs = variant_jobs(comps_path, variants_path, tmp)
+        print(
+            f"{os.path.getsize(comps_path) / 2**20:.1f} MiB comps, {len(jobs)} "
+            f"variant files, {args.categories} categories"
+        )
+
+        old = bench("Group scans", scan_categories, jobs, args.repeat)
+        new = bench("Group id index", index_categories, jobs, args.repeat)
+        if old != new:
+            raise Exception("Group id index categories differ from the scans")
+
+        start = time.perf_counter()
+        for job in jobs:
+            write_variant(*job)
+        print(f"write_variant, all files: {(time.perf_counter() - start) * 1000:.2f}ms")
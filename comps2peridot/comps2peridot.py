@@ -28,15 +28,72 @@
 #  POSSIBILITY OF SUCH DAMAGE.
 
 import argparse
+import importlib.util
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 # noinspection PyPep8Naming
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 
-from group import Group, PackageReq, Environment, EnvGroup
+from group import Group, PackageReq, Environment, EnvGroup, VariantGroup
+
+
+def load_variants_module():
+    # The variants file model is shared with pungicatalog. Only that file is
+    # loaded, putting the pungicatalog directory on sys.path would also make
+    # its other modules (scm, catalog...) importable from here.
+    base = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(base, "..", "pungicatalog", "variants.py")
+    spec = importlib.util.spec_from_file_location("variants", path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so the NamedTuples it defines can be pickled
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+VariantsIndex = load_variants_module().VariantsIndex
+
+
+COMPS_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE comps
+  PUBLIC '-//Red Hat, Inc.//DTD Comps info//EN'
+  'comps.dtd'>
+"""
+
+
+def escape_xml(data):
+    return (
+        data.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
+
+
+def write_pretty_xml(f, elem, level=0):
+    # Same layout as minidom's toprettyxml(indent="  "), elements with only
+    # text are written on one line and empty elements are self-closing
+    indent = "  " * level
+    attrs = "".join([f' {k}="{escape_xml(v)}"' for k, v in elem.attrib.items()])
+    if len(elem) == 0:
+        if elem.text:
+            f.write(f"{indent}<{elem.tag}{attrs}>{escape_xml(elem.text)}</{elem.tag}>\n")
+        else:
+            f.write(f"{indent}<{elem.tag}{attrs}/>\n")
+        return
+    f.write(f"{indent}<{elem.tag}{attrs}>\n")
+    for child in elem:
+        write_pretty_xml(f, child, level + 1)
+    f.write(f"{indent}</{elem.tag}>\n")
 
 
 def write_variant(groups, environments, categories, out):
+    # Categories and environments only reference groups in this variant/arch
+    group_ids = {group.id for group in groups}
+
     root = ET.Element("comps")
     for group in groups:
         group_elem = ET.SubElement(root, "group")
@@ -74,18 +131,17 @@ def write_variant(groups, environments, categories, out):
         ET.SubElement(env_elem, "display_order").text = str(environment.display_order)
         group_list = ET.SubElement(env_elem, "grouplist")
         for group in environment.group_list:
-            ET.SubElement(group_list, "groupid").text = group.name
+            if group.name in group_ids:
+                ET.SubElement(group_list, "groupid").text = group.name
         option_list = ET.SubElement(env_elem, "optionlist")
         for option in environment.option_list:
-            ET.SubElement(option_list, "optionid").text = option.name
+            if option.name in group_ids:
+                ET.SubElement(option_list, "optionid").text = option.name
     for category_name in categories.keys():
         category = categories[category_name]
-        new_group_list = []
-        for group in category.group_list:
-            for ggroup in groups:
-                if ggroup.id == group.name:
-                    new_group_list.append(group)
-                    break
+        new_group_list = [
+            group for group in category.group_list if group.name in group_ids
+        ]
         if len(new_group_list) == 0:
             continue
         category_elem = ET.SubElement(root, "category")
@@ -104,32 +160,44 @@ def write_variant(groups, environments, categories, out):
         group_list = ET.SubElement(category_elem, "grouplist")
         for group in new_group_list:
             ET.SubElement(group_list, "groupid").text = group.name
-    ET.ElementTree(root).write(out, encoding="utf-8", xml_declaration=False)
 
-    with open(out, "r") as f:
-        data = f.read()
-    with open(out, "w") as f:
-        f.writelines(
-            """<?xml version="1.0" encoding="UTF-8"?>
-<!DOCTYPE comps
-  PUBLIC '-//Red Hat, Inc.//DTD Comps info//EN'
-  'comps.dtd'>
-"""
-            + minidom.parseString(data)
-            .toprettyxml(indent="  ")
-            .replace('<?xml version="1.0" ?>\n', "")
-        )
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(COMPS_HEADER)
+        write_pretty_xml(f, root)
+
 
+@lru_cache(maxsize=None)
+def split_arches(value):
+    # Arch lists repeat a lot, share one tuple per distinct attribute value
+    return tuple(value.split(","))
 
-def main(comps_path: str, variants_path: str, output_path: str):
-    default_arches = ["x86_64", "aarch64", "ppc64le", "s390x"]
+
+def iter_comps_elements(comps_path):
+    # Yields the top level elements of a comps file as soon as they are
+    # fully parsed and frees them afterwards, so only one group, environment
+    # or category is kept in memory at a time
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(comps_path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            yield elem
+            root.clear()
+
+
+def variant_jobs(comps_path: str, variants_path: str, output_path: str):
+    # write_variant arguments of every variant/arch file
+    default_arches = ("x86_64", "aarch64", "ppc64le", "s390x")
     variants = {}
     environments = {}
     categories = {}
 
-    tree = ET.parse(comps_path)
-    root = tree.getroot()
-    for gchild in root:
+    for gchild in iter_comps_elements(comps_path):
         if gchild.tag == "group":
             group_name = {}
             group_desc = {}
@@ -141,7 +209,7 @@ def main(comps_path: str, variants_path: str, output_path: str):
             if "variant" in gchild.attrib:
                 variant = gchild.attrib["variant"]
             if "arch" in gchild.attrib:
-                arches = gchild.attrib["arch"].split(",")
+                arches = split_arches(gchild.attrib["arch"])
             else:
                 arches = default_arches
             for gattr in gchild:
@@ -167,6 +235,9 @@ def main(comps_path: str, variants_path: str, output_path: str):
                     is_visible = gattr.text == "true"
                 elif gattr.tag == "packagelist":
                     package_list_xml = gattr
+            # All variants of the group share the package list, per variant
+            # and arch only indexes into it are kept
+            packages = []
             package_list = {}
             if variant != "":
                 package_list[variant] = {}
@@ -178,7 +249,7 @@ def main(comps_path: str, variants_path: str, output_path: str):
                 if "type" in reqxml.attrib:
                     req_type = reqxml.attrib["type"]
                 if "arch" in reqxml.attrib:
-                    req_arches = reqxml.attrib["arch"].split(",")
+                    req_arches = split_arches(reqxml.attrib["arch"])
                 else:
                     req_arches = arches
                 if req_variant not in package_list:
@@ -186,25 +257,31 @@ def main(comps_path: str, variants_path: str, output_path: str):
                 for arch in req_arches:
                     if arch not in package_list[req_variant]:
                         package_list[req_variant][arch] = []
-                    package_list[req_variant][arch].append(
-                        PackageReq(reqxml.text, req_type, req_arches)
-                    )
+                    package_list[req_variant][arch].append(len(packages))
+                packages.append(PackageReq(reqxml.text, req_type, req_arches))
+            packages = tuple(packages)
             for variant in package_list:
                 if variant not in variants:
                     variants[variant] = {}
+                if group_id not in variants[variant]:
+                    variants[variant][group_id] = {}
+                group = Group(
+                    group_id,
+                    group_name,
+                    group_desc,
+                    is_default,
+                    is_visible,
+                    packages,
+                    {
+                        arch: tuple(package_list[variant].get(arch, []))
+                        for arch in arches
+                    },
+                )
+                # A group defined again (usually with other arches) only
+                # replaces the arches it lists, each arch keeps the name,
+                # default... of the definition it comes from
                 for arch in arches:
-                    if arch not in package_list[variant]:
-                        package_list[variant][arch] = []
-                    if group_id not in variants[variant]:
-                        variants[variant][group_id] = {}
-                    variants[variant][group_id][arch] = Group(
-                        group_id,
-                        group_name,
-                        group_desc,
-                        is_default,
-                        is_visible,
-                        package_list[variant][arch],
-                    )
+                    variants[variant][group_id][arch] = group
         elif gchild.tag == "environment" or gchild.tag == "category":
             env_name = {}
             env_desc = {}
@@ -234,14 +311,14 @@ def main(comps_path: str, variants_path: str, output_path: str):
                 elif gattr.tag == "grouplist":
                     for group in gattr:
                         if "arch" in group.attrib:
-                            arches = group.attrib["arch"].split(",")
+                            arches = split_arches(group.attrib["arch"])
                         else:
                             arches = default_arches
                         group_list.append(EnvGroup(group.text, arches))
                 elif gattr.tag == "optionlist":
                     for group in gattr:
                         if "arch" in group.attrib:
-                            arches = group.attrib["arch"].split(",")
+                            arches = split_arches(group.attrib["arch"])
                         else:
                             arches = default_arches
                         option_list.append(EnvGroup(group.text, arches))
@@ -252,7 +329,7 @@ def main(comps_path: str, variants_path: str, output_path: str):
             if gchild.tag == "environment":
                 dictmap = environments
             if "arch" in gchild.attrib:
-                arches = gchild.attrib["arch"].split(",")
+                arches = split_arches(gchild.attrib["arch"])
             else:
                 arches = default_arches
             for arch in arches:
@@ -269,73 +346,80 @@ def main(comps_path: str, variants_path: str, output_path: str):
 
     variant_arch_index = {}
     environment_arch_index = {}
-    pungi_variants_tree = ET.parse(variants_path).getroot()
-    for pungi_variant in pungi_variants_tree:
-        if pungi_variant.tag == "variant":
-            if pungi_variant.attrib["type"] != "variant":
+    variants_index = VariantsIndex.from_file(variants_path)
+    for pungi_variant in variants_index.top_level_variants():
+        groups = {}
+        n_environments = {}
+        variant_id = pungi_variant.id
+        groupbase = variants[""]
+        if variant_id in variants:
+            groupbase = variants[variant_id]
+        for group in pungi_variant.groups:
+            if group.name not in groupbase:
                 continue
-            arches = []
-            groups = {}
-            n_environments = {}
-            variant_id = pungi_variant.attrib["id"]
-            for child in pungi_variant:
-                if child.tag == "arches":
-                    for arch in child:
-                        arches.append(arch.text)
-                elif child.tag == "groups":
-                    for group in child:
-                        groupbase = variants[""]
-                        if variant_id in variants:
-                            groupbase = variants[variant_id]
-                        if group.text not in groupbase:
-                            continue
-                        groupind = groupbase[group.text].copy()
-                        for arch_group in groupind.keys():
-                            if arch_group not in groups:
-                                groups[arch_group] = []
-                            if "default" in group.attrib:
-                                groupind[arch_group].default = (
-                                    group.attrib["default"] == "true"
-                                )
-                            groups[arch_group].append(groupind[arch_group])
-                elif child.tag == "environments":
-                    for environment in child:
-                        envind = environment_id_index[environment.text]
-                        for arch_environment in envind.keys():
-                            if arch_environment not in n_environments:
-                                n_environments[arch_environment] = []
-                            n_environments[arch_environment].append(
-                                envind[arch_environment]
-                            )
-            for arch in arches:
-                if arch in groups:
-                    if arch not in variant_arch_index:
-                        variant_arch_index[arch] = {}
-                    if variant_id not in variant_arch_index[arch]:
-                        variant_arch_index[arch][variant_id] = []
-                    variant_arch_index[arch][variant_id].extend(groups[arch])
-                if arch in n_environments:
-                    if arch not in environment_arch_index:
-                        environment_arch_index[arch] = {}
-                    if variant_id not in environment_arch_index[arch]:
-                        environment_arch_index[arch][variant_id] = []
-                    environment_arch_index[arch][variant_id].extend(
-                        n_environments[arch]
-                    )
+            groupind = groupbase[group.name]
+            for arch_group in groupind.keys():
+                default = groupind[arch_group].default
+                if group.default is not None:
+                    default = group.default
+                if arch_group not in groups:
+                    groups[arch_group] = []
+                groups[arch_group].append(
+                    VariantGroup(groupind[arch_group], arch_group, default)
+                )
+        for environment in pungi_variant.environments:
+            envind = environment_id_index[environment]
+            for arch_environment in envind.keys():
+                if arch_environment not in n_environments:
+                    n_environments[arch_environment] = []
+                n_environments[arch_environment].append(envind[arch_environment])
+        for arch in pungi_variant.arches:
+            if arch in groups:
+                if arch not in variant_arch_index:
+                    variant_arch_index[arch] = {}
+                if variant_id not in variant_arch_index[arch]:
+                    variant_arch_index[arch][variant_id] = []
+                variant_arch_index[arch][variant_id].extend(groups[arch])
+            if arch in n_environments:
+                if arch not in environment_arch_index:
+                    environment_arch_index[arch] = {}
+                if variant_id not in environment_arch_index[arch]:
+                    environment_arch_index[arch][variant_id] = []
+                environment_arch_index[arch][variant_id].extend(
+                    n_environments[arch]
+                )
 
+    write_jobs = []
     for arch in variant_arch_index.keys():
         for variant in variant_arch_index[arch].keys():
-            write_variant(
-                variant_arch_index[arch][variant]
-                if variant in variant_arch_index[arch]
-                else [],
-                environment_arch_index[arch][variant]
-                if variant in environment_arch_index[arch]
-                else [],
-                categories[arch].copy(),
-                f"{output_path}/{variant}-{arch}.xml",
+            write_jobs.append(
+                (
+                    variant_arch_index[arch][variant]
+                    if variant in variant_arch_index[arch]
+                    else [],
+                    environment_arch_index[arch][variant]
+                    if variant in environment_arch_index[arch]
+                    else [],
+                    categories[arch].copy(),
+                    f"{output_path}/{variant}-{arch}.xml",
+                )
             )
 
+    return write_jobs
+
+
+def main(comps_path: str, variants_path: str, output_path: str, jobs: int = 1):
+    # Every variant/arch is written to its own file, so they are independent
+    write_jobs = variant_jobs(comps_path, variants_path, output_path)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(write_variant, *args) for args in write_jobs]
+            for future in futures:
+                future.result()
+    else:
+        for args in write_jobs:
+            write_variant(*args)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -344,5 +428,11 @@ if __name__ == "__main__":
     parser.add_argument("--comps-path", type=str, required=True)
     parser.add_argument("--variants-path", type=str, required=True)
     parser.add_argument("--output-path", type=str, default=".")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes writing variant files in parallel",
+    )
     args = parser.parse_args()
-    main(args.comps_path, args.variants_path, args.output_path)
+    main(args.comps_path, args.variants_path, args.output_path, args.jobs)
@@ -27,34 +27,67 @@
 #  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 #  POSSIBILITY OF SUCH DAMAGE.
 
-from dataclasses import dataclass
+from typing import NamedTuple
 
+# These are immutable tuples without a per instance __dict__. A Group is
+# stored once per definition in the comps file and shared by every arch and
+# pungi variant it is placed in.
 
-@dataclass
-class PackageReq:
+
+class PackageReq(NamedTuple):
     name: str
     type: str
-    arches: list[str]
+    arches: tuple[str, ...]
 
 
-@dataclass
-class Group:
+class Group(NamedTuple):
     id: str
     name: dict[str, str]
     description: dict[str, str]
     default: bool
     user_visible: bool
-    packages: list[PackageReq]
+    packages: tuple[PackageReq, ...]
+    # Indexes into packages for every arch the group is available on
+    arch_packages: dict[str, tuple[int, ...]]
+
+    def packages_for_arch(self, arch):
+        return [self.packages[i] for i in self.arch_packages[arch]]
+
+
+class VariantGroup(NamedTuple):
+    # Group as placed in a pungi variant for one arch, the variant may
+    # override the default flag of the shared Group
+    group: Group
+    arch: str
+    default: bool
+
+    @property
+    def id(self):
+        return self.group.id
+
+    @property
+    def name(self):
+        return self.group.name
+
+    @property
+    def description(self):
+        return self.group.description
+
+    @property
+    def user_visible(self):
+        return self.group.user_visible
+
+    @property
+    def packages(self):
+        return self.group.packages_for_arch(self.arch)
 
 
-@dataclass
-class EnvGroup:
+class EnvGroup(NamedTuple):
     name: str
-    arch: list[str]
+    arch: tuple[str, ...]
 
 
-@dataclass
-class Environment:
+class Environment(NamedTuple):
     id: str
     name: dict[str, str]
     description: dict[str, str]
@@ -0,0 +1,154 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+import xml.etree.ElementTree as ET
+
+from comps2peridot import main
+
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+VARIANTS = """<?xml version="1.0"?>
+<variants>
+  <variant id="BaseOS" name="BaseOS" type="variant">
+    <arches><arch>x86_64</arch><arch>aarch64</arch><arch>s390x</arch></arches>
+    <groups><group>core</group><group>tools</group></groups>
+    <environments><environment>minimal</environment></environments>
+  </variant>
+</variants>
+"""
+
+# core and tools are both defined twice for different arches
+COMPS = """<?xml version="1.0" encoding="UTF-8"?>
+<comps>
+  <group arch="x86_64,aarch64">
+    <id>core</id>
+    <name>Core</name>
+    <name xml:lang="de">Kern</name>
+    <description>Smallest possible installation</description>
+    <default>true</default>
+    <uservisible>false</uservisible>
+    <packagelist>
+      <packagereq type="mandatory">bash</packagereq>
+    </packagelist>
+  </group>
+  <group arch="s390x">
+    <id>core</id>
+    <name>Core S390</name>
+    <description>Core for s390x</description>
+    <default>false</default>
+    <uservisible>true</uservisible>
+    <packagelist>
+      <packagereq type="mandatory">bash</packagereq>
+      <packagereq type="mandatory">s390utils-base</packagereq>
+    </packagelist>
+  </group>
+  <group arch="x86_64,s390x">
+    <id>tools</id>
+    <name>Tools</name>
+    <description>Tools</description>
+    <default>false</default>
+    <uservisible>true</uservisible>
+    <packagelist>
+      <packagereq type="default">gcc</packagereq>
+      <packagereq type="optional" arch="s390x">s390utils</packagereq>
+    </packagelist>
+  </group>
+  <group arch="x86_64,aarch64">
+    <id>tools</id>
+    <name>Tools</name>
+    <description>Tools</description>
+    <default>false</default>
+    <uservisible>true</uservisible>
+    <packagelist>
+      <packagereq type="default">clang</packagereq>
+    </packagelist>
+  </group>
+  <environment>
+    <id>minimal</id>
+    <name>Minimal</name>
+    <description>Minimal</description>
+    <display_order>1</display_order>
+    <grouplist><groupid>core</groupid></grouplist>
+    <optionlist><groupid>tools</groupid></optionlist>
+  </environment>
+  <category>
+    <id>base</id>
+    <name>Base</name>
+    <description>Base</description>
+    <display_order>1</display_order>
+    <grouplist><groupid>core</groupid><groupid>tools</groupid></grouplist>
+  </category>
+</comps>
+"""
+
+
+def convert(tmp_path):
+    (tmp_path / "comps.xml").write_text(COMPS)
+    (tmp_path / "variants.xml").write_text(VARIANTS)
+    out = tmp_path / "out"
+    out.mkdir()
+    main(str(tmp_path / "comps.xml"), str(tmp_path / "variants.xml"), str(out))
+    groups = {}
+    for path in out.iterdir():
+        for group in ET.parse(path).getroot().findall("group"):
+            groups[(path.name, group.findtext("id"))] = {
+                "name": {
+                    name.get(XML_LANG, ""): name.text for name in group.findall("name")
+                },
+                "default": group.findtext("default"),
+                "uservisible": group.findtext("uservisible"),
+                "packages": [req.text for req in group.iter("packagereq")],
+            }
+    return groups
+
+
+def test_repeated_group_keeps_metadata_per_arch(tmp_path):
+    groups = convert(tmp_path)
+
+    for arch in ["x86_64", "aarch64"]:
+        assert groups[(f"BaseOS-{arch}.xml", "core")] == {
+            "name": {"": "Core", "de": "Kern"},
+            "default": "true",
+            "uservisible": "false",
+            "packages": ["bash"],
+        }
+    assert groups[("BaseOS-s390x.xml", "core")] == {
+        "name": {"": "Core S390"},
+        "default": "false",
+        "uservisible": "true",
+        "packages": ["bash", "s390utils-base"],
+    }
+
+
+def test_repeated_group_replaces_only_its_arches(tmp_path):
+    groups = convert(tmp_path)
+
+    assert groups[("BaseOS-x86_64.xml", "tools")]["packages"] == ["clang"]
+    assert groups[("BaseOS-aarch64.xml", "tools")]["packages"] == ["clang"]
+    # Only the first definition has s390x
+    assert groups[("BaseOS-s390x.xml", "tools")]["packages"] == ["gcc", "s390utils"]
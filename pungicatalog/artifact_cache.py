@@ -0,0 +1,76 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Bump when the layout of the cached values changes
+ARTIFACT_CACHE_MAGIC = b"PRCA"
+ARTIFACT_CACHE_VERSION = 5
+
+
+class ArtifactCache:
+    # Parsed SCM artifacts stored by (repo, commit, path). Since commits are
+    # immutable the entries never need invalidation, only the version header
+    # is checked so stale formats are ignored.
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, repo, commit, path, ext_filters):
+        key = "\0".join([repo, commit, path, ",".join(sorted(ext_filters or []))])
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.pickle")
+
+    def header(self):
+        return ARTIFACT_CACHE_MAGIC + ARTIFACT_CACHE_VERSION.to_bytes(4, "little")
+
+    def load(self, repo, commit, path, ext_filters):
+        entry_path = self.entry_path(repo, commit, path, ext_filters)
+        if not os.path.exists(entry_path):
+            return None
+
+        header = self.header()
+        with open(entry_path, "rb") as f:
+            if f.read(len(header)) != header:
+                return None
+            try:
+                return pickle.load(f)
+            except (pickle.UnpicklingError, EOFError):
+                return None
+
+    def store(self, repo, commit, path, ext_filters, values):
+        entry_path = self.entry_path(repo, commit, path, ext_filters)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self.header())
+            pickle.dump(values, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
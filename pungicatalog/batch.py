@@ -0,0 +1,284 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import kobo.conf
+import yaml
+
+from artifact_cache import ArtifactCache
+from pungicatalog import SCM_SOURCES, main
+from scm import SCM, CloneCache
+
+
+def load_manifest(manifest_path, output_format):
+    # A YAML (or JSON) file with a list of releases:
+    #   releases:
+    #     - pungi_conf_path: pungi-rocky-8/rocky.conf
+    #       major: 8
+    #       minor: 6
+    #       output_path: catalog-8.6.cfg
+    # output_path defaults to catalog-<major>.<minor>.cfg, output_format and
+    # incremental can be set per release. Relative paths are resolved against
+    # the manifest directory.
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, "r") as f:
+        manifest = yaml.safe_load(f)
+
+    releases = []
+    for entry in manifest["releases"]:
+        release = {
+            "pungi_conf_path": os.path.join(base, entry["pungi_conf_path"]),
+            "major": int(entry["major"]),
+            "minor": int(entry["minor"]),
+            "output_format": entry.get("output_format", output_format),
+            "incremental": bool(entry.get("incremental", False)),
+        }
+        output_path = entry.get(
+            "output_path", f"catalog-{release['major']}.{release['minor']}.cfg"
+        )
+        release["output_path"] = os.path.join(base, output_path)
+        if release["incremental"] and release["output_format"] != "prototxt":
+            raise Exception(
+                f"{output_path}: incremental is only supported for prototxt output"
+            )
+        releases.append(release)
+
+    output_paths = [release["output_path"] for release in releases]
+    if len(set(output_paths)) != len(output_paths):
+        raise Exception("Releases in the manifest share an output path")
+    return releases
+
+
+def git_sources(pungi_conf_path):
+    # (Pungi option, SCM dict) of the Git sources of a release
+    conf = kobo.conf.PyConfigParser()
+    conf.load_from_file(pungi_conf_path)
+    for key in SCM_SOURCES:
+        scm_dict = conf.get(key)
+        if isinstance(scm_dict, dict) and scm_dict.get("scm") == "git":
+            yield key, scm_dict
+
+
+def prepare_clones(releases, scm_cache_dir, scm_checkout=True):
+    # Every distinct (repo, branch) is cloned or updated once here, the
+    # release builds then only read the clones
+    clone_cache = CloneCache(scm_cache_dir, checkout=scm_checkout)
+    sources = {}
+    for release in releases:
+        for _, scm_dict in git_sources(release["pungi_conf_path"]):
+            sources[(scm_dict["repo"], scm_dict.get("branch"))] = None
+    for repo, branch in sources:
+        clone_cache.get(repo, branch)
+    print(f"Prepared {len(sources)} sources for {len(releases)} releases")
+
+
+def prepare_artifacts(
+    releases, scm_cache_dir, artifact_cache_dir, scm_checkout=True, jobs=1
+):
+    # Sources used by more than one release at the same commit are parsed
+    # once here. The release builds start at the same time, so they would
+    # all miss the artifact cache and parse them again.
+    clone_cache = CloneCache(scm_cache_dir, fetch=False, checkout=scm_checkout)
+    artifact_cache = ArtifactCache(artifact_cache_dir)
+    sources = {}
+    try:
+        for release in releases:
+            pungi_base = os.path.dirname(release["pungi_conf_path"])
+            for key, scm_dict in git_sources(release["pungi_conf_path"]):
+                repo = scm_dict["repo"]
+                commit = clone_cache.resolve(repo, scm_dict.get("branch"))
+                path = scm_dict.get("file") or scm_dict.get("dir")
+                source = (repo, commit, path, key)
+                if source in sources:
+                    sources[source][2] += 1
+                else:
+                    sources[source] = [pungi_base, scm_dict, 1]
+
+        shared = [
+            (key, pungi_base, scm_dict)
+            for (_, _, _, key), (pungi_base, scm_dict, count) in sources.items()
+            if count > 1
+        ]
+        for key, pungi_base, scm_dict in shared:
+            SCM(
+                pungi_base,
+                scm_dict,
+                clone_cache=clone_cache,
+                artifact_cache=artifact_cache,
+                jobs=jobs,
+                **SCM_SOURCES[key],
+            )
+    finally:
+        clone_cache.cleanup()
+    print(f"Parsed {len(shared)} sources shared between releases")
+
+
+def build_release(release, scm_cache_dir, artifact_cache_dir, scm_checkout=True):
+    # The log is returned instead of printed, so the output of parallel
+    # builds doesn't interleave. Returns (log, success), the log of a failed
+    # build ends with the traceback.
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            main(
+                release["pungi_conf_path"],
+                release["output_path"],
+                release["major"],
+                release["minor"],
+                scm_cache_dir=scm_cache_dir,
+                artifact_cache_dir=artifact_cache_dir,
+                incremental=release["incremental"],
+                output_format=release["output_format"],
+                fetch_clones=False,
+                scm_checkout=scm_checkout,
+            )
+    except Exception:
+        log.write(traceback.format_exc())
+        return log.getvalue(), False
+    return log.getvalue(), True
+
+
+def batch_main(
+    manifest_path: str,
+    jobs: int = 1,
+    scm_cache_dir: str = None,
+    artifact_cache_dir: str = None,
+    output_format: str = "prototxt",
+    scm_checkout: bool = True,
+):
+    releases = load_manifest(manifest_path, output_format)
+
+    # Without cache directories the clones and parsed artifacts still have to
+    # be shared between the workers, they are kept for this batch only
+    temp_dir = None
+    if not scm_cache_dir or not artifact_cache_dir:
+        temp_dir = tempfile.mkdtemp(prefix="pungicatalog-")
+        scm_cache_dir = scm_cache_dir or os.path.join(temp_dir, "scm")
+        artifact_cache_dir = artifact_cache_dir or os.path.join(temp_dir, "artifacts")
+
+    failed = []
+    try:
+        prepare_clones(releases, scm_cache_dir, scm_checkout)
+        prepare_artifacts(
+            releases, scm_cache_dir, artifact_cache_dir, scm_checkout, jobs
+        )
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                (
+                    release,
+                    executor.submit(
+                        build_release,
+                        release,
+                        scm_cache_dir,
+                        artifact_cache_dir,
+                        scm_checkout,
+                    ),
+                )
+                for release in releases
+            ]
+            for release, future in futures:
+                name = f"{release['major']}.{release['minor']}"
+                try:
+                    log, success = future.result()
+                except Exception as e:
+                    # The worker itself failed, there is no log
+                    print(f"Failed to build {name}: {e}", file=sys.stderr)
+                    failed.append(name)
+                    continue
+                if success:
+                    print(log, end="")
+                    print(f"Built {name}: {release['output_path']}")
+                else:
+                    print(log, end="", file=sys.stderr)
+                    print(f"Failed to build {name}", file=sys.stderr)
+                    failed.append(name)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir)
+
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build Peridot catalogs for several Pungi configurations."
+    )
+    parser.add_argument("--manifest", type=str, required=True)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of catalogs built in parallel",
+    )
+    parser.add_argument(
+        "--scm-cache-dir",
+        type=str,
+        default=None,
+        help="Keep SCM clones in this directory between runs",
+    )
+    parser.add_argument(
+        "--artifact-cache-dir",
+        type=str,
+        default=None,
+        help="Cache parsed SCM files by commit in this directory",
+    )
+    parser.add_argument(
+        "--scm-no-checkout",
+        action="store_true",
+        help="Read SCM files from the git object database of a partial clone",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        choices=["prototxt", "json", "binary"],
+        default="prototxt",
+        help="Default for releases that don't set one",
+    )
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    failed = batch_main(
+        args.manifest,
+        jobs=args.jobs,
+        scm_cache_dir=args.scm_cache_dir,
+        artifact_cache_dir=args.artifact_cache_dir,
+        output_format=args.output_format,
+        scm_checkout=not args.scm_no_checkout,
+    )
+    if failed:
+        sys.exit(1)
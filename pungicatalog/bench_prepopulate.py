@@ -0,0 +1,270 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from noarch import NoarchExcludes
+from prepopulate import Prepopulate
+
+# Compares the memory of the gather prepopulate loaded as nested dicts with
+# the streamed Prepopulate columns, and the indexing pungicatalog did with
+# list membership checks before with the current one, on a synthetic
+# prepopulate
+
+ARCHES = ["x86_64", "aarch64", "ppc64le", "s390x", "i686", "riscv64"]
+
+LOADERS = {
+    "dicts": json.load,
+    "columns": Prepopulate.load,
+}
+
+
+def make_prepopulate(n_srpms, n_arches, n_repos):
+    arches = ARCHES[:n_arches]
+    gpjson = {f"Repo{i}": {arch: {} for arch in arches} for i in range(n_repos)}
+    for i in range(n_srpms):
+        srpm = f"pkg{i}"
+        # Half of the packages are in the first repo, like AppStream
+        repo = gpjson[f"Repo{0 if i % 2 else i // 2 % n_repos}"]
+        for j, arch in enumerate(arches):
+            # Some packages aren't built for every arch (ExclusiveArch), their
+            # noarch subpackages end up in the arch specific excludes
+            if j and i % (3 + j) == 0:
+                continue
+            nas = [f"{srpm}.{arch}", f"{srpm}-libs.{arch}", f"{srpm}-devel.{arch}"]
+            nas += [f"{srpm}-doc.noarch", f"{srpm}-data.noarch"]
+            # Multilib
+            if arch == "x86_64" and i % 4 == 0:
+                nas.append(f"{srpm}-libs.i686")
+            repo[arch][srpm] = nas
+    return gpjson
+
+
+def list_index(gpjson):
+    # The prepopulate indexing as pungicatalog did it before, with linear
+    # membership checks on lists. Returns the noarch exclude filters and the
+    # (package, [(repo, NAs, multilib arches)]) rows.
+    package_index = {}
+    all_arches = []
+    for repo in gpjson.keys():
+        for arch in gpjson[repo].keys():
+            if arch not in all_arches:
+                all_arches.append(arch)
+            for package in gpjson[repo][arch].keys():
+                if package not in package_index:
+                    package_index[package] = {}
+                if repo not in package_index[package]:
+                    package_index[package][repo] = {
+                        "include_filter": [],
+                        "multilib": [],
+                    }
+                na_list = gpjson[repo][arch][package]
+                for na in na_list:
+                    splitted = na.split(".")
+                    arch_package = splitted[len(splitted) - 1]
+                    if arch != arch_package and arch_package != "noarch":
+                        if arch not in package_index[package][repo]["multilib"]:
+                            package_index[package][repo]["multilib"].append(arch)
+                    if na not in package_index[package][repo]["include_filter"]:
+                        package_index[package][repo]["include_filter"].append(na)
+
+    arch_specific_excludes = {}
+    for pkg in package_index.keys():
+        for repo in package_index[pkg].keys():
+            na_list = list(
+                filter(
+                    lambda x: x.endswith(".noarch"),
+                    package_index[pkg][repo]["include_filter"],
+                )
+            )
+            if not na_list:
+                continue
+            exclude_arches = {}
+            for na in na_list:
+                for arch in all_arches:
+                    if (
+                        arch not in gpjson[repo]
+                        or pkg not in gpjson[repo][arch]
+                        or na not in gpjson[repo][arch][pkg]
+                    ):
+                        if na not in exclude_arches:
+                            exclude_arches[na] = []
+                        exclude_arches[na].append(arch)
+            if not exclude_arches:
+                continue
+            if pkg not in arch_specific_excludes:
+                arch_specific_excludes[pkg] = {}
+            if repo not in arch_specific_excludes[pkg]:
+                arch_specific_excludes[pkg][repo] = []
+            arch_specific_excludes[pkg][repo].append(exclude_arches)
+
+    repo_arch_index = {}
+    for pkg in arch_specific_excludes.keys():
+        for repo in arch_specific_excludes[pkg].keys():
+            if repo not in repo_arch_index:
+                repo_arch_index[repo] = {}
+            for arches2 in arch_specific_excludes[pkg][repo]:
+                for na in arches2.keys():
+                    for arch in arches2[na]:
+                        if arch not in repo_arch_index[repo]:
+                            repo_arch_index[repo][arch] = []
+                        if na not in repo_arch_index[repo][arch]:
+                            repo_arch_index[repo][arch].append(na)
+
+    exclude_filter = []
+    for repo in repo_arch_index.keys():
+        filter_tuple = {}
+        for arch in repo_arch_index[repo].keys():
+            if arch not in filter_tuple:
+                filter_tuple[arch] = []
+            for na in repo_arch_index[repo][arch]:
+                na = na.removesuffix(".noarch")
+                if na not in filter_tuple[arch]:
+                    filter_tuple[arch].append(na)
+        exclude_filter.append((f"^{repo}$", filter_tuple))
+
+    packages = [
+        (
+            package,
+            [
+                (repo, index["include_filter"], index["multilib"])
+                for repo, index in package_index[package].items()
+            ],
+        )
+        for package in package_index
+    ]
+    return exclude_filter, packages
+
+
+def column_index(prepopulate):
+    return (
+        NoarchExcludes(prepopulate).exclude_filters(),
+        list(prepopulate.package_repositories()),
+    )
+
+
+def bench(name, func, *args):
+    start = time.perf_counter()
+    ret = func(*args)
+    print(f"{name}: {time.perf_counter() - start:.3f}s")
+    return ret
+
+
+def load(loader, path):
+    with open(path, "rb") as f:
+        return LOADERS[loader](f)
+
+
+def traced(loader, path):
+    # Retained and peak Python allocations of a load, and its wall time
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = load(loader, path)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del value
+    return elapsed, retained, peak
+
+
+def vm_hwm():
+    # Peak RSS in KiB. Linux only, unlike ru_maxrss it isn't carried over
+    # from the parent through exec.
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+
+
+def peak_rss(loader, path):
+    # Run in a child, so the peak RSS only has the interpreter and one load
+    out = subprocess.run(
+        [sys.executable, __file__, "--rss-child", loader, path],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return [int(kib) for kib in out.split()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark gather prepopulate loading and indexing."
+    )
+    parser.add_argument("--srpms", type=int, default=20000)
+    parser.add_argument("--arches", type=int, default=5)
+    parser.add_argument("--repos", type=int, default=10)
+    parser.add_argument("--rss-child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.rss_child:
+        before = vm_hwm()
+        start = time.perf_counter()
+        value = load(*args.rss_child)
+        elapsed = int((time.perf_counter() - start) * 1000)
+        after = vm_hwm()
+        print(before, after, elapsed)
+        sys.exit(0)
+
+    gpjson = make_prepopulate(args.srpms, args.arches, args.repos)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "prepopulate.json")
+        with open(path, "w") as f:
+            json.dump(gpjson, f)
+        del gpjson
+        print(
+            f"{args.srpms} source packages, {args.arches} arches, {args.repos} "
+            f"repos, {os.path.getsize(path) / 2**20:.1f} MiB of JSON"
+        )
+
+        old = bench("List membership indexing", list_index, load("dicts", path))
+        new = bench("Prepopulate indexing", column_index, load("columns", path))
+        if old != new:
+            raise Exception("Prepopulate indexing differs from list membership")
+        excludes = sum(len(nas) for _, arches in new[0] for nas in arches.values())
+        print(f"{excludes} arch specific noarch excludes")
+
+        for loader in LOADERS:
+            elapsed, retained, peak = traced(loader, path)
+            print(
+                f"{loader}: tracemalloc retained {retained / 2**20:.1f} MiB, "
+                f"peak {peak / 2**20:.1f} MiB ({elapsed:.3f}s traced)"
+            )
+        for loader in LOADERS:
+            before, after, elapsed = peak_rss(loader, path)
+            print(
+                f"{loader}: peak RSS {before / 1024:.0f} MiB -> "
+                f"{after / 1024:.0f} MiB, {elapsed / 1000:.3f}s"
+            )
@@ -0,0 +1,132 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+
+import argparse
+import time
+
+# noinspection PyPep8Naming
+import xml.etree.ElementTree as ET
+
+from variants import VariantsIndex
+
+# Compares the module stream lookups of VariantsIndex with the per repo
+# XPath scans pungicatalog used before, on a synthetic variants file
+
+
+def make_variants(n_variants, n_modules):
+    root = ET.Element("variants")
+    for i in range(n_variants):
+        variant = ET.SubElement(
+            root, "variant", id=f"Repo{i}", name=f"Repo{i}", type="variant"
+        )
+        arches = ET.SubElement(variant, "arches")
+        ET.SubElement(arches, "arch").text = "x86_64"
+        modules = ET.SubElement(variant, "modules")
+        for j in range(i, n_modules, n_variants):
+            ET.SubElement(modules, "module").text = f"pkg{j}:{j % 3}"
+        # Optional variants nested in every variant, like pungi-rocky has
+        children = ET.SubElement(variant, "variants")
+        optional = ET.SubElement(
+            children, "variant", id=f"Repo{i}-optional", type="optional"
+        )
+        ET.SubElement(ET.SubElement(optional, "modules"), "module").text = f"opt{i}:1"
+    return root
+
+
+def xpath_streams(root, repos, packages):
+    # The lookups as pungicatalog did them before VariantsIndex
+    repo_module_index = {}
+    module_name_index = {}
+    for repo in repos:
+        for module in root.findall(f".//variant[@id='{repo}']/modules/module"):
+            repo_module_index.setdefault(repo, []).append(module.text)
+            module_name_index[module.text.split(":")[0]] = True
+
+    ret = {}
+    for repo in repos:
+        for package in packages:
+            if package not in module_name_index or repo not in repo_module_index:
+                continue
+            streams = [
+                module.split(":")[1]
+                for module in repo_module_index[repo]
+                if module.startswith(f"{package}:")
+            ]
+            if streams:
+                ret[(repo, package)] = streams
+    return ret
+
+
+def index_streams(root, repos, packages):
+    index = VariantsIndex(root)
+    module_name_index = {}
+    for repo in repos:
+        for module in index.modules_for_variant(repo):
+            module_name_index[module.split(":")[0]] = True
+
+    ret = {}
+    for repo in repos:
+        for package in packages:
+            if package not in module_name_index:
+                continue
+            streams = index.streams(repo, package)
+            if streams:
+                ret[(repo, package)] = streams
+    return ret
+
+
+def bench(name, func, *args):
+    start = time.perf_counter()
+    ret = func(*args)
+    print(f"{name}: {time.perf_counter() - start:.3f}s")
+    return ret
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark variants file module lookups."
+    )
+    parser.add_argument("--variants", type=int, default=24)
+    parser.add_argument("--modules", type=int, default=3000)
+    parser.add_argument("--packages", type=int, default=5000)
+    args = parser.parse_args()
+
+    root = make_variants(args.variants, args.modules)
+    repos = [f"Repo{i}" for i in range(args.variants)]
+    packages = [f"pkg{i}" for i in range(args.packages)]
+    print(
+        f"{args.variants} variants, {args.modules} modules, "
+        f"{len(repos) * len(packages)} (repo, package) lookups"
+    )
+
+    old = bench("XPath scans", xpath_streams, root, repos, packages)
+    new = bench("VariantsIndex", index_streams, root, repos, packages)
+    if old != new:
+        raise Exception("VariantsIndex streams differ from the XPath scans")
@@ -27,9 +27,12 @@
 #  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 #  POSSIBILITY OF SUCH DAMAGE.
 
+import json
 from dataclasses import dataclass
 from enum import Enum
 
+from protowire import encode_field
+
 
 class PeridotCatalogSyncPackageType(str, Enum):
     PACKAGE_TYPE_NORMAL = "PACKAGE_TYPE_NORMAL"
@@ -46,6 +49,66 @@ class PeridotCatalogSyncPackageType(str, Enum):
     )
 
 
+# Wire format schema of resf.peridot.v1.CatalogSync, field numbers mirror
+# catalog.proto and package.proto in Peridot and have to be kept in sync
+CATALOG_SYNC_SCHEMA = {
+    "CatalogSync": {
+        "package": (1, "CatalogSyncPackage"),
+        "additionalMultilib": (2, "string"),
+        "excludeMultilibFilter": (3, "string"),
+        "excludeFilter": (4, "GlobFilter"),
+        "includeFilter": (5, "GlobFilter"),
+        "moduleConfiguration": (6, "ModuleConfiguration"),
+    },
+    "CatalogSyncPackage": {
+        "name": (1, "string"),
+        "type": (
+            2,
+            {
+                "PACKAGE_TYPE_DEFAULT": 0,
+                **{
+                    t.value: i + 1
+                    for i, t in enumerate(PeridotCatalogSyncPackageType)
+                },
+            },
+        ),
+        "repository": (3, "CatalogSyncRepository"),
+    },
+    "CatalogSyncRepository": {
+        "name": (1, "string"),
+        "includeFilter": (2, "string"),
+        "multilib": (3, "string"),
+        "moduleStream": (4, "string"),
+    },
+    "GlobFilter": {
+        "repoMatch": (1, "string"),
+        "arch": (2, "GlobFilterArch"),
+    },
+    "GlobFilterArch": {
+        "key": (1, "string"),
+        "globMatch": (2, "string"),
+    },
+    "ModuleConfiguration": {
+        "platform": (1, "ModuleConfigurationPlatform"),
+        "default": (2, "ModuleDefault"),
+    },
+    "ModuleConfigurationPlatform": {
+        "major": (1, "int32"),
+        "minor": (2, "int32"),
+        "patch": (3, "int32"),
+    },
+    "ModuleDefault": {
+        "name": (1, "string"),
+        "stream": (2, "string"),
+        "profile": (3, "ModuleDefaultProfile"),
+    },
+    "ModuleDefaultProfile": {
+        "stream": (1, "string"),
+        "name": (2, "string"),
+    },
+}
+
+
 @dataclass
 class PeridotCatalogSyncRepository:
     name: str
@@ -66,6 +129,16 @@ class PeridotCatalogSyncRepository:
     def multilib_to_prototxt(self):
         return "\n" + "\n".join([f'    multilib: "{f}"' for f in self.multilib])
 
+    def to_dict(self):
+        ret = {"name": self.name}
+        if self.module_streams:
+            ret["moduleStream"] = list(self.module_streams)
+        if self.include_filter:
+            ret["includeFilter"] = list(self.include_filter)
+        if self.multilib:
+            ret["multilib"] = list(self.multilib)
+        return ret
+
 
 @dataclass
 class PeridotCatalogSyncPackage:
@@ -89,16 +162,25 @@ class PeridotCatalogSyncPackage:
             ]
         )
 
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "type": self.type.value,
+            "repository": [repo.to_dict() for repo in self.repositories],
+        }
+
 
 class PeridotCatalogSync:
-    additional_multilib: list[str] = []
-    exclude_multilib_filter: list[str] = []
-    exclude_filter: list[tuple[str, dict]] = []
-    include_filter: list[tuple[str, dict]] = []
-    packages: list[PeridotCatalogSyncPackage] = []
-    module_defaults = None
-    major = 0
-    minor = 0
+    def __init__(self, major: int = 0, minor: int = 0):
+        # Per instance, so catalogs built in the same process stay separate
+        self.additional_multilib: list[str] = []
+        self.exclude_multilib_filter: list[str] = []
+        self.exclude_filter: list[tuple[str, dict]] = []
+        self.include_filter: list[tuple[str, dict]] = []
+        self.packages: list[PeridotCatalogSyncPackage] = []
+        self.module_defaults = None
+        self.major = major
+        self.minor = minor
 
     def add_package(self, package: PeridotCatalogSyncPackage):
         self.packages.append(package)
@@ -187,24 +269,118 @@ class PeridotCatalogSync:
             ]
         )
 
-    def to_prototxt(self):
-        ret = f"""# kind: resf.peridot.v1.CatalogSync
-{self.module_configuration_to_prototxt()}{
-        self.additional_multilib_to_prototxt()
-        }{
-        self.exclude_multilib_filter_to_prototxt()
-        }{
-        self.exclude_filter_to_prototxt()
-        }{
-        self.include_filter_to_prototxt()
-        }
-"""
-        for pkg in self.packages:
-            ret += f"""package {{
+    def package_to_prototxt(self, pkg: PeridotCatalogSyncPackage):
+        return f"""package {{
   name: "{pkg.name}"
-  type: {pkg.type}
+  type: {pkg.type.value}
 {pkg.repos_to_prototxt()}
 }}
 """
 
+    def prototxt_sections(self):
+        # Independently rendered parts of the catalog in output order as
+        # (key, source data, renderer). Joining all rendered sections gives
+        # the full prototxt.
+        yield "kind", None, lambda: "# kind: resf.peridot.v1.CatalogSync\n"
+        yield (
+            "module_configuration",
+            [self.major, self.minor, self.module_defaults],
+            self.module_configuration_to_prototxt,
+        )
+        yield (
+            "additional_multilib",
+            self.additional_multilib,
+            self.additional_multilib_to_prototxt,
+        )
+        yield (
+            "exclude_multilib_filter",
+            self.exclude_multilib_filter,
+            self.exclude_multilib_filter_to_prototxt,
+        )
+        yield "exclude_filter", self.exclude_filter, self.exclude_filter_to_prototxt
+        yield (
+            "include_filter",
+            self.include_filter,
+            lambda: self.include_filter_to_prototxt() + "\n",
+        )
+        for pkg in self.packages:
+            yield f"package:{pkg.name}", pkg, lambda pkg=pkg: self.package_to_prototxt(pkg)
+
+    def filter_to_dict(self, f: tuple[str, dict]):
+        return {
+            "repoMatch": f[0],
+            "arch": [{"key": k, "globMatch": list(v)} for k, v in f[1].items()],
+        }
+
+    def module_configuration_to_dict(self):
+        return {
+            "platform": {"major": self.major, "minor": self.minor, "patch": 0},
+            "default": [
+                # YAML loads unquoted streams and profiles such as 10 as
+                # numbers, the proto fields are strings
+                {
+                    "name": str(f["data"]["module"]),
+                    "stream": str(f["data"].get("stream", "")),
+                    "profile": [
+                        {"stream": str(k), "name": [str(p) for p in v]}
+                        for k, v in (f["data"].get("profiles") or {}).items()
+                    ],
+                }
+                for f in self.module_defaults
+            ],
+        }
+
+    def header_to_dict(self):
+        # Everything but the packages in the proto3 JSON shape
+        ret = {}
+        if self.module_defaults:
+            ret["moduleConfiguration"] = self.module_configuration_to_dict()
+        if self.additional_multilib:
+            ret["additionalMultilib"] = list(self.additional_multilib)
+        if self.exclude_multilib_filter:
+            ret["excludeMultilibFilter"] = list(self.exclude_multilib_filter)
+        if self.exclude_filter:
+            ret["excludeFilter"] = [self.filter_to_dict(f) for f in self.exclude_filter]
+        if self.include_filter:
+            ret["includeFilter"] = [self.filter_to_dict(f) for f in self.include_filter]
+        return ret
+
+    def to_dict(self):
+        ret = self.header_to_dict()
+        ret["package"] = [pkg.to_dict() for pkg in self.packages]
         return ret
+
+    def write_json(self, f):
+        f.write("{")
+        for key, value in self.header_to_dict().items():
+            f.write(f"{json.dumps(key)}: {json.dumps(value)}, ")
+        f.write('"package": [')
+        for i, pkg in enumerate(self.packages):
+            if i > 0:
+                f.write(", ")
+            f.write(json.dumps(pkg.to_dict()))
+        f.write("]}\n")
+
+    def write_binary(self, f):
+        # Fields of a message can be written in any order, so packages are
+        # encoded and written one at a time
+        for key, value in self.header_to_dict().items():
+            f.write(encode_field(CATALOG_SYNC_SCHEMA, "CatalogSync", key, value))
+        for pkg in self.packages:
+            f.write(
+                encode_field(
+                    CATALOG_SYNC_SCHEMA, "CatalogSync", "package", pkg.to_dict()
+                )
+            )
+
+    def iter_prototxt(self):
+        for _, _, render in self.prototxt_sections():
+            yield render()
+
+    def write_prototxt(self, f):
+        # Only one package block is rendered at a time
+        for chunk in self.iter_prototxt():
+            f.write(chunk)
+
+    def to_prototxt(self):
+        return "".join(self.iter_prototxt())
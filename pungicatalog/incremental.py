@@ -0,0 +1,162 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import asdict, is_dataclass
+
+# Bump when the prototxt rendering or the fingerprints change so old
+# manifests are not reused
+CATALOG_MANIFEST_VERSION = 3
+
+
+def section_fingerprint(key, data):
+    if is_dataclass(data):
+        data = asdict(data)
+    # Keys are not sorted, the rendered sections follow the dict order (filter
+    # arches, module default profiles...)
+    payload = json.dumps([CATALOG_MANIFEST_VERSION, key, data], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def load_previous_catalog(output_path, manifest_path):
+    if not os.path.exists(output_path) or not os.path.exists(manifest_path):
+        return None, []
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != CATALOG_MANIFEST_VERSION:
+        print("Catalog manifest version changed, regenerating catalog")
+        return None, []
+
+    with open(output_path, "rb") as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != manifest.get("digest"):
+        print(f"{output_path} does not match its manifest, regenerating catalog")
+        return None, []
+
+    return data, manifest["sections"]
+
+
+def write_incremental(catalog, output_path, manifest_path=None):
+    # Writes the catalog reusing the previous output for every section whose
+    # source data did not change. The file is left untouched if no section
+    # changed, so downstream syncs are not triggered needlessly.
+    if not manifest_path:
+        manifest_path = f"{output_path}.manifest.json"
+
+    previous, previous_sections = load_previous_catalog(output_path, manifest_path)
+    previous_index = {section["key"]: section for section in previous_sections}
+
+    added = []
+    changed = []
+    sections = []
+    digest = hashlib.sha256()
+    offset = 0
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for key, data, render in catalog.prototxt_sections():
+                fingerprint = section_fingerprint(key, data)
+                previous_section = previous_index.get(key)
+                if previous_section and previous_section["hash"] == fingerprint:
+                    start = previous_section["offset"]
+                    chunk = previous[start : start + previous_section["length"]]
+                else:
+                    chunk = render().encode("utf-8")
+                    if previous_section:
+                        changed.append(key)
+                    else:
+                        added.append(key)
+
+                f.write(chunk)
+                digest.update(chunk)
+                sections.append(
+                    {
+                        "key": key,
+                        "hash": fingerprint,
+                        "offset": offset,
+                        "length": len(chunk),
+                    }
+                )
+                offset += len(chunk)
+
+        new_keys = [section["key"] for section in sections]
+        new_key_set = set(new_keys)
+        removed = [
+            section["key"]
+            for section in previous_sections
+            if section["key"] not in new_key_set
+        ]
+        reordered = new_keys != [section["key"] for section in previous_sections]
+
+        if previous is not None and not (added or changed or removed or reordered):
+            os.remove(tmp_path)
+            print(f"Catalog unchanged, {output_path} not rewritten")
+            return
+
+        # mkstemp creates the file as 0600, match a plain open() instead
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    with open(manifest_path, "w") as f:
+        json.dump(
+            {
+                "version": CATALOG_MANIFEST_VERSION,
+                "digest": digest.hexdigest(),
+                "sections": sections,
+            },
+            f,
+        )
+
+    if previous is None:
+        print(f"Wrote full catalog ({len(sections)} sections)")
+        return
+
+    print(
+        f"Catalog changes: {len(added)} added, {len(changed)} changed, "
+        f"{len(removed)} removed, "
+        f"{len(sections) - len(added) - len(changed)} unchanged"
+    )
+    for key in added:
+        print(f"  + {key}")
+    for key in changed:
+        print(f"  ~ {key}")
+    for key in removed:
+        print(f"  - {key}")
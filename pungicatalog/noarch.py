@@ -0,0 +1,114 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+
+class NoarchExcludes:
+    # Noarch packages are listed under every arch of a repo in the
+    # prepopulate, but some only ship on a subset of arches. The prepopulate
+    # is inverted once into (repo, na) -> bitmask of arches containing the
+    # NA, and the arches a noarch NA is missing from are the bits not set in
+    # its mask. Arches are global, so a noarch NA in a repo without a
+    # specific arch is excluded for that arch as well.
+    # Works on the columns of a Prepopulate, entries without a noarch NA
+    # are skipped before their NAs are split.
+    def __init__(self, prepopulate):
+        self.prepopulate = prepopulate
+        self.arch_bits = {
+            arch_id: 1 << arch_id for arch_id in range(len(prepopulate.arches))
+        }
+        self.masks = {}
+        # srpm id -> repo id -> noarch NAs, insertion ordered. Ids follow
+        # the document order, so sorting srpm ids gives the package order of
+        # the prepopulate.
+        self.package_index = {}
+        self.all_arches_mask = (1 << len(self.arch_bits)) - 1
+
+        for repo_id, arch_id, srpm_id, nas in zip(
+            prepopulate.entry_repo,
+            prepopulate.entry_arch,
+            prepopulate.entry_srpm,
+            prepopulate.entry_nas,
+        ):
+            if ".noarch" not in nas:
+                continue
+            bit = self.arch_bits[arch_id]
+            for na in nas.split("\n"):
+                if not na.endswith(".noarch"):
+                    continue
+                repos = self.package_index.get(srpm_id)
+                if repos is None:
+                    repos = self.package_index[srpm_id] = {}
+                repo_nas = repos.get(repo_id)
+                if repo_nas is None:
+                    repo_nas = repos[repo_id] = {}
+                repo_nas[na] = None
+                key = (repo_id, na)
+                self.masks[key] = self.masks.get(key, 0) | bit
+
+    def missing_mask(self, repo_id, na):
+        mask = self.masks.get((repo_id, na), 0)
+        return self.all_arches_mask & ~mask
+
+    def missing_arches(self, repo_id, na):
+        missing = self.missing_mask(repo_id, na)
+        return [
+            self.prepopulate.arches[arch_id]
+            for arch_id, bit in self.arch_bits.items()
+            if missing & bit
+        ]
+
+    def repo_arch_excludes(self):
+        # repo -> arch -> noarch NAs missing from that arch
+        prepopulate = self.prepopulate
+        ret = {}
+        for srpm_id in sorted(self.package_index):
+            repos = self.package_index[srpm_id]
+            for repo_id in sorted(repos):
+                for na in repos[repo_id]:
+                    missing = self.missing_mask(repo_id, na)
+                    if not missing:
+                        continue
+                    arch_index = ret.setdefault(prepopulate.repos[repo_id], {})
+                    for arch_id, bit in self.arch_bits.items():
+                        if missing & bit:
+                            arch = prepopulate.arches[arch_id]
+                            arch_index.setdefault(arch, {})[na] = None
+        return ret
+
+    def exclude_filters(self):
+        return [
+            (
+                f"^{repo}$",
+                {
+                    arch: list({na.removesuffix(".noarch"): None for na in na_list})
+                    for arch, na_list in arch_index.items()
+                },
+            )
+            for repo, arch_index in self.repo_arch_excludes().items()
+        ]
@@ -0,0 +1,261 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import codecs
+import io
+import json
+from array import array
+from json.decoder import WHITESPACE, scanstring
+
+DECODER = json.JSONDecoder()
+
+
+class StringTable:
+    # Every distinct string stored once, ids are assigned in first seen order
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def intern(self, s):
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def __getitem__(self, i):
+        return self.strings[i]
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __iter__(self):
+        return iter(self.strings)
+
+    def find(self, s):
+        # -1 if missing, linear once frozen so only meant for small tables
+        if self.ids is not None:
+            return self.ids.get(s, -1)
+        try:
+            return self.strings.index(s)
+        except ValueError:
+            return -1
+
+    def freeze(self):
+        # The reverse index is only needed while loading
+        self.ids = None
+
+
+class JSONStream:
+    # Reads a JSON document from a binary file object a chunk at a time.
+    # Objects are walked key by key with keys(), values are decoded whole
+    # with value(). Only the text of the value being decoded is kept.
+    def __init__(self, fp, chunk_size=1 << 16):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size):
+        data = self.fp.read(size)
+        self.eof = not data
+        text = self.decoder.decode(data, final=self.eof)
+        self.buffer = self.buffer[self.pos :] + text
+        self.pos = 0
+
+    def peek(self):
+        # Next character after whitespace, "" at the end of the document
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos : self.pos + 1]
+            self.fill(self.chunk_size)
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise json.JSONDecodeError(
+                f"Expecting one of {chars!r}", self.buffer, self.pos
+            )
+        self.pos += 1
+        return c
+
+    def decode(self, func):
+        # func(buffer, pos) returns (value, end) and raises JSONDecodeError
+        # if the value runs past the buffer, it is retried with twice as
+        # much text until the end of the file
+        while True:
+            try:
+                value, self.pos = func(self.buffer, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill(max(self.chunk_size, len(self.buffer)))
+
+    def keys(self):
+        # Yields the keys of an object, the caller reads each value before
+        # asking for the next key
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                self.expect('"')
+            key = self.decode(lambda s, pos: scanstring(s, pos + 1))
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    def value(self):
+        # Only containers, a truncated number would decode without error
+        if self.peek() not in ("{", "["):
+            self.expect("{[")
+        return self.decode(DECODER.raw_decode)
+
+    def end(self):
+        if self.peek():
+            raise json.JSONDecodeError("Extra data", self.buffer, self.pos)
+
+
+class Prepopulate:
+    # The gather prepopulate ({repo: {arch: {source package: ["name.arch"]}}})
+    # as string tables and columns. There is one entry per
+    # (repo, arch, source package) in document order. The NAs of an entry
+    # are kept as one newline separated string, joining them is done in C
+    # while loading and costs far less than a str object and a hash per NA.
+    # Ids are assigned in document order, sorting by id gives first seen
+    # order.
+    def __init__(self):
+        self.repos = StringTable()
+        self.arches = StringTable()
+        self.srpms = StringTable()
+
+        self.entry_repo = array("i")
+        self.entry_arch = array("i")
+        self.entry_srpm = array("i")
+        self.entry_nas = []
+
+    @classmethod
+    def load(cls, fp, chunk_size=1 << 16):
+        # Streams the JSON from a binary file object, every arch object is
+        # turned into columns as soon as it is decoded. Neither the whole
+        # text nor the nested dicts exist at once.
+        prepopulate = cls()
+        stream = JSONStream(fp, chunk_size)
+        for repo in stream.keys():
+            repo_id = prepopulate.repos.intern(repo)
+            for arch in stream.keys():
+                arch_id = prepopulate.arches.intern(arch)
+                prepopulate.add_packages(repo_id, arch_id, stream.value())
+        stream.end()
+        prepopulate.freeze()
+        return prepopulate
+
+    @classmethod
+    def loads(cls, text):
+        return cls.load(io.BytesIO(text.encode()))
+
+    def add_packages(self, repo_id, arch_id, packages):
+        # packages is the {source package: ["name.arch"]} object of an arch
+        srpm_ids = array("i", map(self.srpms.intern, packages))
+        self.entry_repo.extend(array("i", [repo_id]) * len(srpm_ids))
+        self.entry_arch.extend(array("i", [arch_id]) * len(srpm_ids))
+        self.entry_srpm.extend(srpm_ids)
+        self.entry_nas.extend(map("\n".join, packages.values()))
+
+    def freeze(self):
+        for table in [self.repos, self.arches, self.srpms]:
+            table.freeze()
+
+    def entries_by_srpm(self):
+        # Entry indexes grouped by source package with a counting sort,
+        # document order is kept within a package. Returns (starts, order),
+        # the entries of srpm i are order[starts[i]:starts[i + 1]].
+        starts = array("i", [0]) * (len(self.srpms) + 1)
+        for srpm_id in self.entry_srpm:
+            starts[srpm_id + 1] += 1
+        for i in range(len(self.srpms)):
+            starts[i + 1] += starts[i]
+        fill = array("i", starts)
+        order = array("i", [0]) * len(self.entry_srpm)
+        for i, srpm_id in enumerate(self.entry_srpm):
+            order[fill[srpm_id]] = i
+            fill[srpm_id] += 1
+        return starts, order
+
+    def package_repositories(self):
+        # (source package, [(repo, NAs, multilib arches)]) in first seen
+        # order, the shape the catalog packages are built from. Only one
+        # package is indexed at a time.
+        starts, order = self.entries_by_srpm()
+        suffixes = [(f".{arch}\n", f".{arch}") for arch in self.arches]
+        for srpm_id in range(len(self.srpms)):
+            repos = {}
+            for i in order[starts[srpm_id] : starts[srpm_id + 1]]:
+                repo_id = self.entry_repo[i]
+                repo_index = repos.get(repo_id)
+                if repo_index is None:
+                    repo_index = repos[repo_id] = ({}, {})
+                include_filter, multilib = repo_index
+                nas = self.entry_nas[i]
+                if not nas:
+                    continue
+                na_list = nas.split("\n")
+                include_filter.update(dict.fromkeys(na_list))
+                arch_id = self.entry_arch[i]
+                arch = self.arches[arch_id]
+                if arch in multilib:
+                    continue
+                # The NAs of the arch or noarch are counted in C, only entries
+                # with another arch are checked one NA at a time. The last
+                # NA isn't followed by a newline.
+                nl_suffix, suffix = suffixes[arch_id]
+                matched = (
+                    nas.count(nl_suffix)
+                    + nas.count(".noarch\n")
+                    + nas.endswith((suffix, ".noarch"))
+                )
+                if matched == len(na_list):
+                    continue
+                for na in na_list:
+                    # What follows the last dot, the whole NA if there is none
+                    arch_package = na.rpartition(".")[2]
+                    if arch != arch_package and arch_package != "noarch":
+                        multilib[arch] = None
+                        break
+
+            yield self.srpms[srpm_id], [
+                (self.repos[repo_id], list(include_filter), list(multilib))
+                for repo_id, (include_filter, multilib) in repos.items()
+            ]
@@ -0,0 +1,87 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+# Minimal protobuf wire format encoder for messages described as
+# {field name: (number, type)} schemas, with values in the proto3 JSON
+# shape (lists for repeated fields, dicts for messages). type is "string",
+# "int32", an enum dict of {name: number} or the name of another message
+# in the schema.
+
+WIRE_TYPE_VARINT = 0
+WIRE_TYPE_LEN = 2
+
+
+def encode_varint(value: int) -> bytes:
+    if value < 0:
+        value += 1 << 64
+    ret = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            ret.append(byte | 0x80)
+        else:
+            ret.append(byte)
+            return bytes(ret)
+
+
+def encode_tag(number: int, wire_type: int) -> bytes:
+    return encode_varint(number << 3 | wire_type)
+
+
+def encode_field(schema, message_name, field_name, value) -> bytes:
+    if value is None:
+        return b""
+    if isinstance(value, list):
+        return b"".join(
+            [encode_field(schema, message_name, field_name, v) for v in value]
+        )
+
+    number, field_type = schema[message_name][field_name]
+    if field_type == "string":
+        data = value.encode("utf-8")
+        return encode_tag(number, WIRE_TYPE_LEN) + encode_varint(len(data)) + data
+    elif field_type == "int32":
+        return encode_tag(number, WIRE_TYPE_VARINT) + encode_varint(int(value))
+    elif isinstance(field_type, dict):
+        return encode_tag(number, WIRE_TYPE_VARINT) + encode_varint(
+            field_type[value]
+        )
+
+    data = encode_message(schema, field_type, value)
+    return encode_tag(number, WIRE_TYPE_LEN) + encode_varint(len(data)) + data
+
+
+def encode_message(schema, message_name, value: dict) -> bytes:
+    return b"".join(
+        [
+            encode_field(schema, message_name, field_name, field_value)
+            for field_name, field_value in value.items()
+        ]
+    )
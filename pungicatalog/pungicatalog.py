@@ -29,33 +29,44 @@
 
 import argparse
 import os
-import yaml
 
 import kobo.conf
 
+from artifact_cache import ArtifactCache
 from catalog import (
     PeridotCatalogSync,
     PeridotCatalogSyncPackage,
     PeridotCatalogSyncPackageType,
     PeridotCatalogSyncRepository,
 )
-from scm import SCM
-
-def get_modules_for_repo(package, repo, module_index):
-    if not repo in module_index:
-        return None
-
-    modules = []
-    for module in module_index[repo]:
-        if module.startswith(f"{package}:"):
-            modules.append(module.split(":")[1])
-
-    if len(modules) == 0:
-        return None
-
-    return modules
-
-def main(pungi_conf_path: str, output_path: str, major: int, minor: int):
+from incremental import write_incremental
+from noarch import NoarchExcludes
+from prepopulate import Prepopulate
+from scm import SCM, CloneCache
+from variants import VariantsIndex
+
+# Pungi options pointing at sources the catalog is built from, with the
+# SCM arguments they are loaded with
+SCM_SOURCES = {
+    "gather_prepopulate": {"json_loader": Prepopulate.load},
+    "variants_file": {},
+    "module_defaults_dir": {"ext_filters": [".yaml"]},
+}
+
+
+def main(
+    pungi_conf_path: str,
+    output_path: str,
+    major: int,
+    minor: int,
+    scm_cache_dir: str = None,
+    artifact_cache_dir: str = None,
+    incremental: bool = False,
+    output_format: str = "prototxt",
+    fetch_clones: bool = True,
+    jobs: int = 1,
+    scm_checkout: bool = True,
+):
     pungi_base = os.path.dirname(pungi_conf_path)
     print(f"Using pungi base: {pungi_base}")
 
@@ -63,27 +74,57 @@ def main(pungi_conf_path: str, output_path: str, major: int, minor: int):
     conf.load_from_file(pungi_conf_path)
     print(f"Loaded pungi config: {pungi_conf_path}")
 
-    print("Loading prepopulate...")
-    gather_prepopulate_scm_dict = conf.get("gather_prepopulate")
-    gpscm = SCM(pungi_base, gather_prepopulate_scm_dict)
-    gpjson = gpscm.json()
-
-    # Get variants
-    print("Loading variants...")
-    variants_file_scm_dict = conf.get("variants_file")
-    vscm = SCM(pungi_base, variants_file_scm_dict)
-    vxml = vscm.xml()
-
-    # Get module defaults
-    print("Loading module defaults...")
-    module_defaults_file_scm_dict = conf.get("module_defaults_dir")
-    mdscm = SCM(pungi_base, module_defaults_file_scm_dict, ext_filters=[".yaml"])
-    mdtexts = mdscm.texts()
+    # All SCM sources share clones, pungi-rocky usually has everything in one repo
+    clone_cache = CloneCache(scm_cache_dir, fetch=fetch_clones, checkout=scm_checkout)
+    artifact_cache = ArtifactCache(artifact_cache_dir) if artifact_cache_dir else None
+    try:
+        print("Loading prepopulate...")
+        gather_prepopulate_scm_dict = conf.get("gather_prepopulate")
+        gpscm = SCM(
+            pungi_base,
+            gather_prepopulate_scm_dict,
+            clone_cache=clone_cache,
+            artifact_cache=artifact_cache,
+            **SCM_SOURCES["gather_prepopulate"],
+        )
+        prepopulate = gpscm.json()
+
+        # Get variants
+        print("Loading variants...")
+        variants_file_scm_dict = conf.get("variants_file")
+        vscm = SCM(
+            pungi_base,
+            variants_file_scm_dict,
+            clone_cache=clone_cache,
+            artifact_cache=artifact_cache,
+            **SCM_SOURCES["variants_file"],
+        )
+        variants_index = VariantsIndex(vscm.xml())
+
+        # Get module defaults
+        print("Loading module defaults...")
+        module_defaults_file_scm_dict = conf.get("module_defaults_dir")
+        mdscm = SCM(
+            pungi_base,
+            module_defaults_file_scm_dict,
+            clone_cache=clone_cache,
+            artifact_cache=artifact_cache,
+            jobs=jobs,
+            **SCM_SOURCES["module_defaults_dir"],
+        )
+        # The directory may also hold other modulemd documents (obsoletes...)
+        # and YAML that isn't a mapping at all (empty documents, lists)
+        module_defaults = [
+            document
+            for document in mdscm.yamls()
+            if isinstance(document, dict)
+            and document.get("document", "modulemd-defaults") == "modulemd-defaults"
+        ]
+    finally:
+        clone_cache.cleanup()
 
     # Create a catalog
-    catalog = PeridotCatalogSync()
-    catalog.major = major
-    catalog.minor = minor
+    catalog = PeridotCatalogSync(major, minor)
 
     # Set multilib filters
     catalog.additional_multilib.extend(list(conf.get("multilib_whitelist").values())[0])
@@ -96,118 +137,23 @@ def main(pungi_conf_path: str, output_path: str, major: int, minor: int):
     catalog.include_filter.extend(conf.get("additional_packages"))
 
     # Create indexes
-    package_index = {}
-    repo_module_index = {}
     module_name_index = {}
-    module_defaults = []
 
     # Add modules
-    for repo in gpjson.keys():
-        xml_path = f".//variant[@id='{repo}']/modules/module"
-        modules = vxml.findall(xml_path)
-        # No modules in repo, continue
-        if len(modules) == 0:
-            continue
-        for module in modules:
-            module_name = module.text.split(":")[0]
-            if not repo in repo_module_index:
-                repo_module_index[repo] = []
-            repo_module_index[repo].append(module.text)
-            module_name_index[module_name] = True
-            print(f"Found module: {module.text}")
+    for repo in prepopulate.repos:
+        for module in variants_index.modules_for_variant(repo):
+            module_name_index[module.split(":")[0]] = True
+            print(f"Found module: {module}")
 
     # Add module defaults
-    for mdtext in mdtexts:
-        md = yaml.safe_load(mdtext)
-        module_defaults.append(md)
-
     if len(module_defaults) > 0:
         catalog.module_defaults = module_defaults
 
-    # Read prepopulate json and create package objects
-    all_arches = []
-    for repo in gpjson.keys():
-        for arch in gpjson[repo].keys():
-            if arch not in all_arches:
-                all_arches.append(arch)
-            for package in gpjson[repo][arch].keys():
-                if package not in package_index:
-                    package_index[package] = {}
-                if repo not in package_index[package]:
-                    package_index[package][repo] = {
-                        "include_filter": [],
-                        "multilib": [],
-                    }
-                na_list = gpjson[repo][arch][package]
-                for na in na_list:
-                    splitted = na.split(".")
-                    arch_package = splitted[len(splitted) - 1]
-                    if arch != arch_package and arch_package != "noarch":
-                        if arch not in package_index[package][repo]["multilib"]:
-                            package_index[package][repo]["multilib"].append(arch)
-                    if na not in package_index[package][repo]["include_filter"]:
-                        package_index[package][repo]["include_filter"].append(na)
-
-    arch_specific_excludes = {}
-    na_index = {}
-    for pkg in package_index.keys():
-        for repo in package_index[pkg].keys():
-            na_list = list(
-                filter(
-                    lambda x: x.endswith(".noarch"),
-                    package_index[pkg][repo]["include_filter"],
-                )
-            )
-            if not na_list:
-                continue
-            exclude_arches = {}
-            for na in na_list:
-                for arch in all_arches:
-                    if (
-                        arch not in gpjson[repo]
-                        or pkg not in gpjson[repo][arch]
-                        or na not in gpjson[repo][arch][pkg]
-                    ):
-                        if na not in exclude_arches:
-                            exclude_arches[na] = []
-                        exclude_arches[na].append(arch)
-                na_index[na] = na
-            if not exclude_arches:
-                continue
-            if pkg not in arch_specific_excludes:
-                arch_specific_excludes[pkg] = {}
-            if repo not in arch_specific_excludes[pkg]:
-                arch_specific_excludes[pkg][repo] = []
-            arch_specific_excludes[pkg][repo].append(exclude_arches)
-
-    # Index arch specific excludes by repo and arch
-    repo_arch_index = {}
-    for pkg in arch_specific_excludes.keys():
-        for repo in arch_specific_excludes[pkg].keys():
-            if repo not in repo_arch_index:
-                repo_arch_index[repo] = {}
-            for arches2 in arch_specific_excludes[pkg][repo]:
-                for na in arches2.keys():
-                    for arch in arches2[na]:
-                        if arch not in repo_arch_index[repo]:
-                            repo_arch_index[repo][arch] = []
-                        if na not in repo_arch_index[repo][arch]:
-                            repo_arch_index[repo][arch].append(na)
-
     # Add noarch packages not in a specific arch to exclude filter
-    for repo in repo_arch_index.keys():
-        repo_key = f"^{repo}$"
-        filter_tuple = {}
-        for arch in repo_arch_index[repo].keys():
-            if arch not in filter_tuple:
-                filter_tuple[arch] = []
-            for na in repo_arch_index[repo][arch]:
-                na = na.removesuffix(".noarch")
-                if na not in filter_tuple[arch]:
-                    filter_tuple[arch].append(na)
-        catalog.exclude_filter.append((repo_key, filter_tuple))
-
-    for package in package_index.keys():
+    catalog.exclude_filter.extend(NoarchExcludes(prepopulate).exclude_filters())
+
+    # Create package objects from the prepopulate
+    for package, repositories in prepopulate.package_repositories():
         package_type = PeridotCatalogSyncPackageType.PACKAGE_TYPE_NORMAL_FORK
         if package in module_name_index:
             package_type = PeridotCatalogSyncPackageType.PACKAGE_TYPE_NORMAL_FORK_MODULE
@@ -220,21 +166,29 @@ def main(pungi_conf_path: str, output_path: str, major: int, minor: int):
                 package_type,
                 [
                     PeridotCatalogSyncRepository(
-                        x,
-                        package_index[package][x]["include_filter"],
-                        package_index[package][x]["multilib"],
-                        (get_modules_for_repo(package, x, repo_module_index) if x in repo_module_index else None) if package in module_name_index else None,
+                        repo,
+                        include_filter,
+                        multilib,
+                        variants_index.streams(repo, package) if package in module_name_index else None,
                     )
-                    for x in package_index[package].keys()
+                    for repo, include_filter, multilib in repositories
                 ],
             )
         )
 
     print(f"Found {len(catalog.packages)} packages")
 
-    f = open(output_path, "w")
-    f.write(catalog.to_prototxt())
-    f.close()
+    if output_format == "json":
+        with open(output_path, "w") as f:
+            catalog.write_json(f)
+    elif output_format == "binary":
+        with open(output_path, "wb") as f:
+            catalog.write_binary(f)
+    elif incremental:
+        write_incremental(catalog, output_path)
+    else:
+        with open(output_path, "w") as f:
+            catalog.write_prototxt(f)
 
     print(f"Catalog written to {output_path}")
 
@@ -246,5 +200,52 @@ if __name__ == "__main__":
     parser.add_argument("--major", type=int, required=True)
     parser.add_argument("--minor", type=int, required=True)
     parser.add_argument("--output-path", type=str, default="catalog.cfg")
+    parser.add_argument(
+        "--scm-cache-dir",
+        type=str,
+        default=None,
+        help="Keep SCM clones in this directory between runs",
+    )
+    parser.add_argument(
+        "--artifact-cache-dir",
+        type=str,
+        default=None,
+        help="Cache parsed SCM files by commit in this directory",
+    )
+    parser.add_argument(
+        "--scm-no-checkout",
+        action="store_true",
+        help="Read SCM files from the git object database of a partial clone",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only rewrite catalog sections that changed since the last run",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes parsing module defaults in parallel",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        choices=["prototxt", "json", "binary"],
+        default="prototxt",
+    )
     args = parser.parse_args()
-    main(args.pungi_conf_path, args.output_path, args.major, args.minor)
+    if args.incremental and args.output_format != "prototxt":
+        parser.error("--incremental is only supported for prototxt output")
+    main(
+        args.pungi_conf_path,
+        args.output_path,
+        args.major,
+        args.minor,
+        scm_cache_dir=args.scm_cache_dir,
+        artifact_cache_dir=args.artifact_cache_dir,
+        incremental=args.incremental,
+        output_format=args.output_format,
+        jobs=args.jobs,
+        scm_checkout=not args.scm_no_checkout,
+    )
@@ -28,14 +28,239 @@
 #  POSSIBILITY OF SUCH DAMAGE.
 
 import xml.etree.ElementTree as ET
+import contextlib
+import hashlib
 import json
 import os
+import re
 import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import yaml
+from git import Git, GitCommandError, Repo
+
+# libyaml is several times faster than the pure Python loader
+YAMLLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def is_yaml_file(file):
+    return file.endswith(".yaml") or file.endswith(".yml")
+
+
+@lru_cache(maxsize=None)
+def object_repo(git_dir, pid):
+    # Keyed by pid too, a Repo inherited from a forked parent would share
+    # the pipes of its cat-file process
+    return Repo(git_dir)
+
+
+def read_source(source):
+    # source is a path on disk or a (git dir, blob sha) pair, see
+    # CloneCache.list_dir. Returns bytes.
+    if isinstance(source, tuple):
+        git_dir, hexsha = source
+        odb = object_repo(git_dir, os.getpid()).odb
+        return odb.stream(bytes.fromhex(hexsha)).read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def load_yaml_file(source):
+    # Returns every document in the file, module defaults files often hold
+    # more than one. Empty documents are dropped.
+    start = time.perf_counter()
+    if isinstance(source, tuple):
+        stream = read_source(source)
+    else:
+        stream = open(source, "r")
+    try:
+        documents = [
+            document
+            for document in yaml.load_all(stream, Loader=YAMLLoader)
+            if document is not None
+        ]
+    finally:
+        if not isinstance(stream, bytes):
+            stream.close()
+    return documents, time.perf_counter() - start
+
+
+def load_yaml_files(files, jobs=1):
+    # files are (name, source) pairs. They are read and parsed by the
+    # workers, so the raw texts are never held together in memory. Documents
+    # are returned in file order.
+    sources = [source for _, source in files]
+    if jobs > 1 and len(sources) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            chunksize = max(1, len(sources) // (jobs * 4))
+            results = list(executor.map(load_yaml_file, sources, chunksize=chunksize))
+    else:
+        results = [load_yaml_file(source) for source in sources]
+
+    values = []
+    for (name, _), (documents, seconds) in zip(files, results):
+        print(f"Parsed {name}: {len(documents)} documents in {seconds * 1000:.1f}ms")
+        values.extend(documents)
+    return values
+
+
+class CloneCache:
+    # Clones are shared between all SCM instances using the same cache, so
+    # a pungi repo referenced multiple times is only cloned once per run.
+    # If cache_dir is set, clones are kept between runs and updated with a
+    # shallow fetch instead of a full clone. With fetch=False, clones already
+    # in cache_dir are used as they are, e.g. when another process prepared
+    # them.
+    # With checkout=False, repos are cloned without a working tree and with
+    # a blob filter, files are read from the object database and only the
+    # blobs actually read are downloaded.
+    def __init__(self, cache_dir=None, fetch=True, checkout=True):
+        self.cache_dir = cache_dir
+        self.fetch = fetch
+        self.checkout = checkout
+        self.clones = {}
+        self.temp_dir = None
+
+    def clone_path(self, repo, branch):
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            repo_hash = hashlib.sha256(repo.encode()).hexdigest()[:16]
+            branch_name = re.sub(r"[^A-Za-z0-9._-]", "_", branch or "HEAD")
+            return os.path.join(self.cache_dir, f"{repo_hash}-{branch_name}")
+
+        if not self.temp_dir:
+            self.temp_dir = tempfile.TemporaryDirectory()
+        return os.path.join(self.temp_dir.name, str(len(self.clones)))
+
+    def get(self, repo, branch):
+        key = (repo, branch)
+        if key in self.clones:
+            return self.clones[key]
+
+        path = self.clone_path(repo, branch)
+        if self.is_prepared(path):
+            print(f"Using {repo} in {path}")
+        elif os.path.isdir(os.path.join(path, ".git")):
+            print(f"Updating {repo} in {path}")
+            git_repo = Repo(path)
+            git_repo.remotes.origin.fetch(branch or "HEAD", depth=1)
+            mode = "--hard" if self.checkout else "--soft"
+            git_repo.git.reset(mode, "FETCH_HEAD")
+        else:
+            print(f"Cloning {repo}")
+            kwargs = {"depth": 1}
+            if branch:
+                kwargs["branch"] = branch
+            if not self.checkout:
+                kwargs["no_checkout"] = True
+                kwargs["filter"] = "blob:none"
+            Repo.clone_from(repo, path, **kwargs)
+
+        self.clones[key] = path
+        return path
+
+    def is_prepared(self, path):
+        return not self.fetch and os.path.isdir(os.path.join(path, ".git"))
+
+    def resolve(self, repo, branch):
+        # Resolve the remote head without cloning, returns None if the ref
+        # is not a branch or tag (e.g. a plain commit)
+        if self.cache_dir and self.is_prepared(self.clone_path(repo, branch)):
+            return self.commit(repo, branch)
+        ref = branch or "HEAD"
+        refs = {}
+        for line in Git().ls_remote(repo, ref).splitlines():
+            sha, name = line.split("\t", 1)
+            refs[name] = sha
+        for name in [f"refs/heads/{ref}", f"refs/tags/{ref}^{{}}", f"refs/tags/{ref}", ref]:
+            if name in refs:
+                return refs[name]
+        return None
+
+    def commit(self, repo, branch):
+        return Repo(self.get(repo, branch)).head.commit.hexsha
+
+    def read_file(self, repo, branch, path):
+        clone_path = self.get(repo, branch)
+        if self.checkout:
+            with open(os.path.join(clone_path, path), "r") as f:
+                return f.read()
+        blob = Repo(clone_path).head.commit.tree / path
+        return blob.data_stream.read().decode()
+
+    @contextlib.contextmanager
+    def open_file(self, repo, branch, path):
+        # Binary file object for streaming parsers, the blob stream has to
+        # be read to the end before the repo is used again
+        clone_path = self.get(repo, branch)
+        if self.checkout:
+            with open(os.path.join(clone_path, path), "rb") as f:
+                yield f
+        else:
+            yield (Repo(clone_path).head.commit.tree / path).data_stream
+
+    def list_dir(self, repo, branch, path):
+        # (name, source) pairs of the files in path, see read_source. Sorted
+        # by name like git trees, so both modes list files in the same order.
+        clone_path = self.get(repo, branch)
+        if self.checkout:
+            file_dir = os.path.join(clone_path, path)
+            return [
+                (file, os.path.join(file_dir, file))
+                for file in sorted(os.listdir(file_dir))
+                if file not in [".git"]
+            ]
+        git_repo = Repo(clone_path)
+        return [
+            (blob.name, (git_repo.git_dir, blob.hexsha))
+            for blob in (git_repo.head.commit.tree / path).blobs
+        ]
+
+    def prefetch(self, repo, branch, sources):
+        # A partial clone fetches missing blobs one at a time when they are
+        # read, this gets them in a single fetch instead
+        shas = [source[1] for source in sources if isinstance(source, tuple)]
+        if self.checkout or not shas:
+            return
+        git_repo = Repo(self.get(repo, branch))
+        promisor = git_repo.git.config(
+            "--get", "remote.origin.promisor", with_exceptions=False
+        )
+        if promisor != "true":
+            return
+        try:
+            # Like git's own lazy fetch, wants are not negotiated against the
+            # shallow history
+            git_repo.git(c="fetch.negotiationAlgorithm=noop").fetch(
+                "--no-tags",
+                "--no-write-fetch-head",
+                "--filter=blob:none",
+                "origin",
+                *shas,
+            )
+        except GitCommandError as e:
+            print(f"Prefetching blobs failed, reading them one by one: {e}")
+
+    def cleanup(self):
+        if self.temp_dir:
+            self.temp_dir.cleanup()
+            self.temp_dir = None
+        self.clones = {}
 
-from git import Repo
 
 class SCM:
-    def __init__(self, pungi_base, scm_dict, ext_filters=None):
+    def __init__(
+        self,
+        pungi_base,
+        scm_dict,
+        ext_filters=None,
+        clone_cache=None,
+        artifact_cache=None,
+        jobs=1,
+        json_loader=json.load,
+    ):
         # Temporary hack since pungi-rocky usually has everything in one repo anyways
         # todo(mustafa): remove this hack
         base_file_path = ""
@@ -55,38 +280,90 @@ class SCM:
 
         file_contents = None
         file_list_contents = []
+        yaml_files = []
 
         if  isinstance(scm_dict, str) or scm_dict["scm"] == "file":
             file_path = os.path.join(pungi_base, base_file_path)
 
+            if base_file_path.endswith(".json"):
+                with open(file_path, "rb") as f:
+                    self.json_value = json_loader(f)
+                return
+
             f = open(file_path, "r")
             file_contents = f.read()
             f.close()
         elif scm_dict["scm"] == "git":
-            with tempfile.TemporaryDirectory() as d:
-                print(f"Cloning {scm_dict['repo']}")
-                Repo.clone_from(scm_dict["repo"], d, branch=scm_dict["branch"], depth=1)
+            own_cache = clone_cache is None
+            if own_cache:
+                clone_cache = CloneCache()
+            try:
+                repo = scm_dict["repo"]
+                branch = scm_dict.get("branch")
+                artifact_path = base_file_path or base_file_dir
 
-                if base_file_path:
+                if artifact_cache:
+                    commit = clone_cache.resolve(repo, branch)
+                    if commit:
+                        values = artifact_cache.load(
+                            repo, commit, artifact_path, ext_filters
+                        )
+                        if values is not None:
+                            print(f"Using cached {artifact_path} at {commit}")
+                            self.__dict__.update(values)
+                            return
+
+                if base_file_path.endswith(".json"):
+                    print(f"Found file {base_file_path}")
+                    # JSON is handed to the loader as a stream, the prepopulate
+                    # is too large to hold as text next to its parsed form
+                    with clone_cache.open_file(repo, branch, base_file_path) as f:
+                        self.json_value = json_loader(f)
+                elif base_file_path:
                     print(f"Found file {base_file_path}")
-                    file_path = os.path.join(d, base_file_path)
-                    f = open(file_path, "r")
-                    file_contents = f.read()
-                    f.close()
+                    file_contents = clone_cache.read_file(repo, branch, base_file_path)
                 elif base_file_dir:
                     print(f"Reading files from {base_file_dir}")
-                    file_dir = os.path.join(d, base_file_dir)
-                    for file in os.listdir(file_dir):
-                        if file in [".git"]:
-                            continue
-                        if ext_filters:
-                            if not any(file.endswith(ext) for ext in ext_filters):
-                                continue
-                        file_path = os.path.join(file_dir, file)
-                        f = open(file_path, "r")
-                        file_list_contents.append(f.read())
-                        f.close()
+                    files = clone_cache.list_dir(repo, branch, base_file_dir)
+                    if ext_filters:
+                        files = [
+                            (file, source)
+                            for file, source in files
+                            if any(file.endswith(ext) for ext in ext_filters)
+                        ]
+                    clone_cache.prefetch(
+                        repo, branch, [source for _, source in files]
+                    )
+                    for file, source in files:
+                        if is_yaml_file(file):
+                            yaml_files.append((file, source))
+                        else:
+                            file_list_contents.append(
+                                (file, read_source(source).decode())
+                            )
 
+                if not base_file_path.endswith(".json"):
+                    self.parse(base_file_path, file_contents, file_list_contents)
+                if base_file_dir:
+                    # YAML files aren't kept as text, the workers parse them
+                    # straight from disk or the object database
+                    self.yaml_values = load_yaml_files(yaml_files, jobs)
+                if artifact_cache:
+                    artifact_cache.store(
+                        repo,
+                        clone_cache.commit(repo, branch),
+                        artifact_path,
+                        ext_filters,
+                        self.__dict__,
+                    )
+                return
+            finally:
+                if own_cache:
+                    clone_cache.cleanup()
+
+        self.parse(base_file_path, file_contents, file_list_contents)
+
+    def parse(self, base_file_path, file_contents, file_list_contents):
         if file_contents:
             if base_file_path.endswith(".json"):
                 self.json_value = json.loads(file_contents)
@@ -94,8 +371,8 @@ class SCM:
                 self.xml_value = ET.fromstring(file_contents)
             else:
                 self.text_value = file_contents
-        elif file_list_contents:
-            self.text_values = file_list_contents
+        else:
+            self.text_values = [text for _, text in file_list_contents]
 
     def json(self):
         return self.json_value
@@ -108,3 +385,6 @@ class SCM:
 
     def texts(self):
         return self.text_values
+
+    def yamls(self):
+        return self.yaml_values
@@ -0,0 +1,207 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+
+import io
+import json
+
+import yaml
+
+from catalog import (
+    CATALOG_SYNC_SCHEMA,
+    PeridotCatalogSync,
+    PeridotCatalogSyncPackage,
+    PeridotCatalogSyncPackageType,
+    PeridotCatalogSyncRepository,
+)
+from protowire import WIRE_TYPE_LEN, WIRE_TYPE_VARINT
+
+# Catalogs of all three output formats are brought to the same shape to be
+# compared: every field is a list of values, empty lists are dropped and
+# field names use the proto3 JSON (camelCase) spelling.
+
+MODULE_DEFAULTS = """
+document: modulemd-defaults
+version: 1
+data:
+  module: nodejs
+  stream: 10
+  profiles:
+    10: [common]
+    12: [minimal, development]
+---
+document: modulemd-defaults
+version: 1
+data:
+  module: httpd
+  stream: "2.4"
+  profiles:
+    "2.4": [common]
+"""
+
+
+def decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def decode_message(message_name, data):
+    fields = {
+        number: (name, field_type)
+        for name, (number, field_type) in CATALOG_SYNC_SCHEMA[message_name].items()
+    }
+    ret = {}
+    pos = 0
+    while pos < len(data):
+        tag, pos = decode_varint(data, pos)
+        name, field_type = fields[tag >> 3]
+        if tag & 7 == WIRE_TYPE_VARINT:
+            value, pos = decode_varint(data, pos)
+            if isinstance(field_type, dict):
+                value = {v: k for k, v in field_type.items()}[value]
+        else:
+            assert tag & 7 == WIRE_TYPE_LEN
+            length, pos = decode_varint(data, pos)
+            value = data[pos : pos + length]
+            pos += length
+            if field_type == "string":
+                value = value.decode("utf-8")
+            else:
+                value = decode_message(field_type, value)
+        ret.setdefault(name, []).append(value)
+    return ret
+
+
+def camel_case(name):
+    first, *rest = name.split("_")
+    return first + "".join([part.capitalize() for part in rest])
+
+
+def parse_prototxt(text):
+    # Only handles the one field per line layout written by the catalog
+    stack = [{}]
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line == "}":
+            stack.pop()
+        elif line.endswith("{"):
+            message = {}
+            stack[-1].setdefault(camel_case(line[:-1].strip()), []).append(message)
+            stack.append(message)
+        else:
+            name, value = [part.strip() for part in line.split(":", 1)]
+            if value.startswith('"'):
+                value = json.loads(value)
+            elif value.isdigit():
+                value = int(value)
+            stack[-1].setdefault(camel_case(name), []).append(value)
+    assert len(stack) == 1
+    return stack[0]
+
+
+def normalize(value):
+    if isinstance(value, dict):
+        ret = {}
+        for name, field_value in value.items():
+            if not isinstance(field_value, list):
+                field_value = [field_value]
+            if field_value:
+                ret[name] = [normalize(v) for v in field_value]
+        return ret
+    return value
+
+
+def make_catalog():
+    catalog = PeridotCatalogSync(9, 2)
+    catalog.module_defaults = [
+        {"data": f["data"]} for f in yaml.safe_load_all(MODULE_DEFAULTS)
+    ]
+    catalog.additional_multilib.extend(["glibc-devel"])
+    catalog.exclude_filter.append(
+        ("^AppStream$", {"x86_64": ["foo.noarch"], "aarch64": []})
+    )
+    catalog.include_filter.append(("^BaseOS$", {"x86_64": ["bar.i686"]}))
+    catalog.add_package(
+        PeridotCatalogSyncPackage(
+            "nodejs",
+            PeridotCatalogSyncPackageType.PACKAGE_TYPE_NORMAL_FORK_MODULE,
+            [PeridotCatalogSyncRepository("AppStream", [], [], ["nodejs:10"])],
+        )
+    )
+    catalog.add_package(
+        PeridotCatalogSyncPackage(
+            "glibc",
+            PeridotCatalogSyncPackageType.PACKAGE_TYPE_NORMAL_FORK,
+            [
+                PeridotCatalogSyncRepository(
+                    "BaseOS", ["glibc.x86_64", "glibc.i686"], ["x86_64"], None
+                ),
+                PeridotCatalogSyncRepository("CRB", ["glibc-static.x86_64"], [], None),
+            ],
+        )
+    )
+    return catalog
+
+
+def test_formats_round_trip():
+    catalog = make_catalog()
+
+    text = io.StringIO()
+    catalog.write_prototxt(text)
+    prototxt = parse_prototxt(text.getvalue())
+
+    text = io.StringIO()
+    catalog.write_json(text)
+    from_json = normalize(json.loads(text.getvalue()))
+
+    data = io.BytesIO()
+    catalog.write_binary(data)
+    from_binary = decode_message("CatalogSync", data.getvalue())
+
+    assert from_json == prototxt
+    assert from_binary == prototxt
+
+
+def test_numeric_module_streams_are_strings():
+    defaults = make_catalog().module_configuration_to_dict()["default"]
+
+    assert defaults[0]["stream"] == "10"
+    assert defaults[0]["profile"] == [
+        {"stream": "10", "name": ["common"]},
+        {"stream": "12", "name": ["minimal", "development"]},
+    ]
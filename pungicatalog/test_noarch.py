@@ -0,0 +1,66 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+
+import json
+
+from noarch import NoarchExcludes
+from prepopulate import Prepopulate
+
+
+def exclude_filters(gpjson):
+    return NoarchExcludes(Prepopulate.loads(json.dumps(gpjson))).exclude_filters()
+
+
+def test_noarch_missing_from_arches():
+    gpjson = {
+        "BaseOS": {
+            "x86_64": {"a": ["a.x86_64", "a-doc.noarch"], "b": ["b-data.noarch"]},
+            "aarch64": {"a": ["a.aarch64"], "b": ["b-data.noarch"]},
+        },
+        "AppStream": {"s390x": {"c": ["c.s390x"]}},
+    }
+
+    # Arches are global, BaseOS is also missing s390x
+    assert exclude_filters(gpjson) == [
+        ("^BaseOS$", {"aarch64": ["a-doc"], "s390x": ["a-doc", "b-data"]})
+    ]
+
+
+def test_names_without_arch_are_not_noarch():
+    gpjson = {
+        "BaseOS": {
+            "x86_64": {"a": ["a.x86_64", "weird"]},
+            "aarch64": {"a": ["a.aarch64"]},
+        }
+    }
+
+    assert exclude_filters(gpjson) == []
+    gpjson["BaseOS"]["x86_64"]["b"] = ["b.noarch"]
+    assert exclude_filters(gpjson) == [("^BaseOS$", {"aarch64": ["b"]})]
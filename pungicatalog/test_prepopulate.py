@@ -0,0 +1,96 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+import io
+import json
+
+import pytest
+
+from prepopulate import Prepopulate
+
+GPJSON = {
+    "BaseOS": {
+        "x86_64": {
+            "a": ["a.x86_64", "a-libs.i686", "a-doc.noarch"],
+            "b": ["b.x86_64", "b-data.noarch"],
+        },
+        "aarch64": {"a": ["a.aarch64", "a-doc.noarch"], "c": []},
+    },
+    "AppStream": {"x86_64": {"a": ["a-devel.x86_64"], "d": ["d.i686"]}},
+    "Empty": {},
+}
+
+
+def test_package_repositories():
+    expected = [
+        (
+            "a",
+            [
+                (
+                    "BaseOS",
+                    ["a.x86_64", "a-libs.i686", "a-doc.noarch", "a.aarch64"],
+                    ["x86_64"],
+                ),
+                ("AppStream", ["a-devel.x86_64"], []),
+            ],
+        ),
+        ("b", [("BaseOS", ["b.x86_64", "b-data.noarch"], [])]),
+        ("c", [("BaseOS", [], [])]),
+        ("d", [("AppStream", ["d.i686"], ["x86_64"])]),
+    ]
+    text = json.dumps(GPJSON, indent=1)
+    for chunk_size in [1, 7, 1 << 16]:
+        # Small chunks split the values across reads
+        prepopulate = Prepopulate.load(io.BytesIO(text.encode()), chunk_size)
+        assert list(prepopulate.repos) == ["BaseOS", "AppStream", "Empty"]
+        assert list(prepopulate.package_repositories()) == expected
+
+
+def test_multilib_of_names_without_arch():
+    # A NA without a dot is compared with the arch as a whole
+    prepopulate = Prepopulate.loads(
+        json.dumps(
+            {
+                "BaseOS": {
+                    "x86_64": {"a": ["x86_64", "noarch"], "b": ["b.x86_64", "b"]}
+                }
+            }
+        )
+    )
+    assert list(prepopulate.package_repositories()) == [
+        ("a", [("BaseOS", ["x86_64", "noarch"], [])]),
+        ("b", [("BaseOS", ["b.x86_64", "b"], ["x86_64"])]),
+    ]
+
+
+@pytest.mark.parametrize(
+    "text", ['{"BaseOS": {"x86_64": {"a": []}}', '{"BaseOS": 1}', "{} {}", ""]
+)
+def test_invalid_json(text):
+    with pytest.raises(json.JSONDecodeError):
+        Prepopulate.loads(text)
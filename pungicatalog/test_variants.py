@@ -0,0 +1,119 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+
+# noinspection PyPep8Naming
+import xml.etree.ElementTree as ET
+
+from variants import Variant, VariantGroupRef, VariantsIndex
+
+VARIANTS = """<?xml version="1.0"?>
+<variants>
+  <variant id="BaseOS" name="BaseOS" type="variant">
+    <arches><arch>x86_64</arch><arch>aarch64</arch></arches>
+    <groups>
+      <group>core</group>
+      <group default="true">base</group>
+      <group default="false">standard</group>
+    </groups>
+    <environments><environment>minimal-environment</environment></environments>
+  </variant>
+  <variant id="AppStream" name="AppStream" type="variant">
+    <arches><arch>x86_64</arch></arches>
+    <modules>
+      <module>nodejs:10</module>
+      <module>nodejs:12</module>
+      <module>perl</module>
+    </modules>
+    <variants>
+      <variant id="AppStream-optional" name="optional" type="optional">
+        <arches><arch>x86_64</arch></arches>
+        <modules><module>nodejs:14</module></modules>
+      </variant>
+    </variants>
+  </variant>
+  <variant id="HighAvailability" name="HighAvailability" type="addon">
+    <arches><arch>x86_64</arch></arches>
+  </variant>
+</variants>
+"""
+
+
+def make_index():
+    return VariantsIndex(ET.fromstring(VARIANTS))
+
+
+def test_variants():
+    index = make_index()
+
+    assert [variant.id for variant in index.variants] == [
+        "BaseOS",
+        "AppStream-optional",
+        "AppStream",
+        "HighAvailability",
+    ]
+    assert index.variants[0] == Variant(
+        "BaseOS",
+        "variant",
+        None,
+        ("x86_64", "aarch64"),
+        (
+            VariantGroupRef("core", None),
+            VariantGroupRef("base", True),
+            VariantGroupRef("standard", False),
+        ),
+        ("minimal-environment",),
+        (),
+    )
+    assert index.variants[1].parent == "AppStream"
+    assert index.variants[1].type == "optional"
+    assert [variant.id for variant in index.top_level_variants()] == [
+        "BaseOS",
+        "AppStream",
+    ]
+
+
+def test_modules_and_streams():
+    index = make_index()
+
+    assert index.modules_for_variant("AppStream") == [
+        "nodejs:10",
+        "nodejs:12",
+        "perl",
+    ]
+    assert index.modules_for_variant("AppStream-optional") == ["nodejs:14"]
+    assert index.modules_for_variant("BaseOS") == []
+    assert index.modules_for_variant("Missing") == []
+
+    assert index.streams("AppStream", "nodejs") == ["10", "12"]
+    assert index.streams("AppStream-optional", "nodejs") == ["14"]
+    # Modules without a stream and unknown modules have no streams
+    assert index.streams("AppStream", "perl") is None
+    assert index.streams("AppStream", "nodejs-docs") is None
+    assert index.streams("BaseOS", "nodejs") is None
@@ -0,0 +1,128 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+# noinspection PyPep8Naming
+import xml.etree.ElementTree as ET
+from typing import NamedTuple, Optional
+
+
+class VariantGroupRef(NamedTuple):
+    name: str
+    # None if the variant doesn't override the comps default
+    default: Optional[bool]
+
+
+class Variant(NamedTuple):
+    id: str
+    type: str
+    # Id of the variant this one is nested in (optional, addons...)
+    parent: Optional[str]
+    arches: tuple[str, ...]
+    groups: tuple[VariantGroupRef, ...]
+    environments: tuple[str, ...]
+    # "name:stream" as listed in the variants file
+    modules: tuple[str, ...]
+
+
+class VariantsIndex:
+    # Everything the tools need from a pungi variants file, collected in one
+    # pass over the tree. Lookups by variant id and (variant id, module name)
+    # are dict accesses instead of XPath scans.
+    def __init__(self, root: ET.Element):
+        self.variants: list[Variant] = []
+        self.modules: dict[str, list[str]] = {}
+        self.module_streams: dict[tuple[str, str], list[str]] = {}
+        self.collect(root, None)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(ET.parse(path).getroot())
+
+    def collect(self, elem, parent):
+        for child in elem:
+            if child.tag == "variant":
+                self.add_variant(child, parent)
+            else:
+                self.collect(child, parent)
+
+    def add_variant(self, elem, parent):
+        variant_id = elem.attrib["id"]
+        arches = []
+        groups = []
+        environments = []
+        modules = []
+        for child in elem:
+            if child.tag == "arches":
+                arches.extend(arch.text for arch in child)
+            elif child.tag == "groups":
+                for group in child:
+                    default = None
+                    if "default" in group.attrib:
+                        default = group.attrib["default"] == "true"
+                    groups.append(VariantGroupRef(group.text, default))
+            elif child.tag == "environments":
+                environments.extend(environment.text for environment in child)
+            elif child.tag == "modules":
+                modules.extend(module.text for module in child)
+            else:
+                # Nested variants
+                self.collect(child, variant_id)
+
+        self.variants.append(
+            Variant(
+                variant_id,
+                elem.attrib.get("type", "variant"),
+                parent,
+                tuple(arches),
+                tuple(groups),
+                tuple(environments),
+                tuple(modules),
+            )
+        )
+        self.modules.setdefault(variant_id, []).extend(modules)
+        for module in modules:
+            parts = module.split(":")
+            if len(parts) > 1:
+                key = (variant_id, parts[0])
+                self.module_streams.setdefault(key, []).append(parts[1])
+
+    def top_level_variants(self):
+        # Variants of type "variant" that aren't nested in another one
+        return [
+            variant
+            for variant in self.variants
+            if variant.parent is None and variant.type == "variant"
+        ]
+
+    def modules_for_variant(self, variant_id):
+        return self.modules.get(variant_id, [])
+
+    def streams(self, variant_id, module_name):
+        # None instead of an empty list, like the catalog expects
+        return self.module_streams.get((variant_id, module_name)) or None
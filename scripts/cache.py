@@ -0,0 +1,128 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS 'AS IS'
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_CACHE_TTL = 300
+# MiB
+DEFAULT_CACHE_MAX_SIZE = 256
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "peridot-releng", "http")
+
+
+class ResponseCache:
+    # JSON responses stored by URL. Entries younger than ttl are used as is,
+    # older ones are revalidated with their ETag. The file mtime doubles as
+    # the LRU clock, and once the entries outgrow max_size the least
+    # recently used ones are removed.
+    def __init__(self, cache_dir=None, ttl=DEFAULT_CACHE_TTL, max_size=None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.ttl = ttl
+        if max_size is None:
+            max_size = DEFAULT_CACHE_MAX_SIZE * 1024 * 1024
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.size = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def entry_path(self, url):
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def load(self, url):
+        try:
+            with open(self.entry_path(url)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry.get("url") != url:
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry["stored"] < self.ttl
+
+    def touch(self, url):
+        try:
+            os.utime(self.entry_path(url))
+        except FileNotFoundError:
+            pass
+
+    def store(self, url, etag, body):
+        entry = {"url": url, "etag": etag, "stored": time.time(), "body": body}
+        entry_path = self.entry_path(url)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        size = os.path.getsize(tmp_path)
+        with self.lock:
+            if self.size is None:
+                self.size = self.disk_size()
+            try:
+                self.size -= os.path.getsize(entry_path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, entry_path)
+            self.size += size
+            if self.size > self.max_size:
+                self.evict()
+        return entry
+
+    def entries(self):
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            yield st.st_mtime, st.st_size, name
+
+    def disk_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Down to 90% of max_size, so every store doesn't rescan the directory
+        target = self.max_size * 9 // 10
+        for _, size, name in sorted(self.entries()):
+            if self.size <= target:
+                break
+            try:
+                os.unlink(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            self.size -= size
@@ -0,0 +1,239 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS 'AS IS'
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import os
+import tempfile
+
+from common import DEFAULT_CONCURRENCY, iter_items, iter_pages
+
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+    # Progress of one paginated listing, kept as NDJSON: a header naming the
+    # listing, one line per completed page and a final line once the listing
+    # was exhausted. Pages are appended as they complete, so a run that dies
+    # only loses the pages in flight. A line cut short by a crash is dropped
+    # on load.
+    def __init__(self, path, listing):
+        self.path = path
+        self.listing = listing
+        self.pages = {}
+        self.done = False
+        self.f = None
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return False
+        if not lines:
+            return False
+        header = json.loads(lines[0])
+        if header.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"{self.path}: unsupported checkpoint version")
+        if header.get("listing") != self.listing:
+            raise ValueError(
+                f"{self.path} is a checkpoint for {header.get('listing')}, "
+                f"not {self.listing}"
+            )
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if entry.get("done"):
+                self.done = True
+                break
+            self.pages[entry["page"]] = entry["items"]
+        return True
+
+    def items(self):
+        for page in sorted(self.pages):
+            yield from self.pages[page]
+
+    def last_page(self):
+        return max(self.pages, default=None)
+
+    def open(self):
+        # Rewrites the loaded pages without the done marker, then appends
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                header = {"version": CHECKPOINT_VERSION, "listing": self.listing}
+                f.write(json.dumps(header) + "\n")
+                for page in sorted(self.pages):
+                    f.write(json.dumps({"page": page, "items": self.pages[page]}))
+                    f.write("\n")
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.done = False
+        self.f = open(self.path, "a")
+
+    def record(self, page, items):
+        self.pages[page] = items
+        self.f.write(json.dumps({"page": page, "items": items}) + "\n")
+        self.f.flush()
+
+    def record_items(self, items):
+        # For listings that aren't resumed by page, items are recorded under
+        # the next free page number
+        last_page = self.last_page()
+        self.record(0 if last_page is None else last_page + 1, items)
+
+    def finish(self):
+        self.done = True
+        self.f.write(json.dumps({"done": True}) + "\n")
+        self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+def iter_checkpointed_items(
+    fetch_page,
+    checkpoint,
+    concurrency=DEFAULT_CONCURRENCY,
+    resume=False,
+    incremental=False,
+    key=None,
+):
+    # resume: replays the items of the completed pages, then continues after
+    # the last one (nothing is fetched if the listing was finished).
+    # incremental: fetches again from the last recorded page, which may have
+    # grown since, and only yields items whose key wasn't recorded before.
+    # This relies on the API listing items in a stable order, so new ones
+    # are appended at the end.
+    # Without either, the listing starts over and the checkpoint is replaced.
+    if resume or incremental:
+        checkpoint.load()
+    seen = None
+    start_page = 0
+    last_page = checkpoint.last_page()
+    if resume:
+        yield from checkpoint.items()
+        if checkpoint.done:
+            return
+        if last_page is not None:
+            start_page = last_page + 1
+    elif incremental:
+        key = key or (lambda item: json.dumps(item, sort_keys=True))
+        seen = {key(item) for item in checkpoint.items()}
+        if last_page is not None:
+            start_page = last_page
+    else:
+        checkpoint.pages = {}
+
+    checkpoint.open()
+    try:
+        for page, items in iter_pages(fetch_page, concurrency, start_page):
+            checkpoint.record(page, items)
+            if seen is None:
+                yield from items
+                continue
+            for item in items:
+                k = key(item)
+                if k not in seen:
+                    seen.add(k)
+                    yield item
+        checkpoint.finish()
+    finally:
+        checkpoint.close()
+
+
+def iter_unrecorded_items(
+    fetch_page, checkpoint, concurrency=DEFAULT_CONCURRENCY, key=None
+):
+    # For listings that shrink as they are worked on (e.g. packages without
+    # builds), where page numbers don't stay put between runs: lists from the
+    # first page and skips items whose key was recorded by an earlier run.
+    # Nothing is recorded here, the caller records the keys with
+    # record_items once it has handled the items.
+    key = key or (lambda item: json.dumps(item, sort_keys=True))
+    seen = set(checkpoint.items())
+    for item in iter_items(fetch_page, concurrency):
+        k = key(item)
+        if k not in seen:
+            seen.add(k)
+            yield item
+
+
+def add_checkpoint_arguments(parser, resume=True):
+    # resume=False leaves out --resume, for listings that can't be continued
+    # from a page number
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default=None,
+        help="Record listing progress in this file",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    if resume:
+        mode.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the listing recorded in --checkpoint",
+        )
+    else:
+        parser.set_defaults(resume=False)
+    mode.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only output items not recorded in --checkpoint by the last run",
+    )
+
+
+def check_checkpoint_arguments(parser, args):
+    if (args.resume or args.incremental) and not args.checkpoint:
+        if args.resume:
+            parser.error("--resume requires --checkpoint")
+        parser.error("--incremental requires --checkpoint")
+
+
+def iter_listing_items(args, fetch_page, listing, key=None, checkpoint_path=None):
+    # checkpoint_path overrides --checkpoint, for scripts running several
+    # listings
+    checkpoint_path = checkpoint_path or args.checkpoint
+    if not checkpoint_path:
+        return iter_items(fetch_page, args.concurrency)
+    return iter_checkpointed_items(
+        fetch_page,
+        Checkpoint(checkpoint_path, listing),
+        args.concurrency,
+        resume=args.resume,
+        incremental=args.incremental,
+        key=key,
+    )
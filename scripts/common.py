@@ -27,8 +27,31 @@
 #  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 #  POSSIBILITY OF SUCH DAMAGE.
 
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cache import DEFAULT_CACHE_MAX_SIZE, DEFAULT_CACHE_TTL, ResponseCache
+
 BASE_URL = "https://peridot-api.build.resf.org/v1"
 PROJECT_ID_PROD = "55b17281-bc54-4929-8aca-a8a11d628738"
+# Number of pages requested ahead while paginating
+DEFAULT_CONCURRENCY = 8
+# Seconds, for connecting and for each read
+DEFAULT_TIMEOUT = 30
+DEFAULT_RETRIES = 5
+# Retries wait backoff * 2^(retry - 1) seconds unless Retry-After says otherwise
+DEFAULT_BACKOFF = 1
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+# Packages per batch request
+DEFAULT_CHUNK_SIZE = 400
 
 
 def construct_url(path, project_id=PROJECT_ID_PROD):
@@ -40,3 +63,193 @@ def build_batches_url(batch_type, task_id, page, status, project_id=PROJECT_ID_P
         f"/{batch_type}_batches/{task_id}?page={page}&limit=100&filter.status={status}",
         project_id,
     )
+
+
+class PeridotClient:
+    # One pooled session per script, so pages reuse connections instead of
+    # doing a TCP and TLS handshake each. Transient errors (429/5xx and
+    # connection errors) are retried with exponential backoff, honoring
+    # Retry-After. GETs go through the response cache when one is given.
+    def __init__(
+        self,
+        timeout=DEFAULT_TIMEOUT,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        pool_size=DEFAULT_CONCURRENCY,
+        token=None,
+        cache=None,
+    ):
+        self.timeout = timeout
+        self.cache = cache
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        r = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        r.raise_for_status()
+        return r
+
+    def get_json(self, url):
+        if self.cache is None:
+            return self.request("GET", url).json()
+
+        entry = self.cache.load(url)
+        if entry is not None and self.cache.is_fresh(entry):
+            self.cache.touch(url)
+            return entry["body"]
+        headers = {}
+        if entry is not None and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        r = self.request("GET", url, headers=headers)
+        if r.status_code == 304:
+            return self.cache.store(url, entry["etag"], entry["body"])["body"]
+        body = r.json()
+        self.cache.store(url, r.headers.get("ETag"), body)
+        return body
+
+    def post_json(self, url, body):
+        return self.request("POST", url, json=body).json()
+
+
+def add_client_arguments(parser):
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES)
+    parser.add_argument("--backoff", type=float, default=DEFAULT_BACKOFF)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of pages requested in parallel",
+    )
+    parser.add_argument(
+        "--token",
+        type=str,
+        default=os.environ.get("PERIDOT_TOKEN"),
+        help="Bearer token, defaults to $PERIDOT_TOKEN",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Cache API responses on disk",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Defaults to ~/.cache/peridot-releng/http",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_CACHE_TTL,
+        help="Seconds a cached response is used without revalidation",
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        type=int,
+        default=DEFAULT_CACHE_MAX_SIZE,
+        help="Size of the cache in MiB",
+    )
+
+
+def client_from_args(args, pool_size=None):
+    cache = None
+    if args.cache:
+        cache = ResponseCache(
+            args.cache_dir, args.cache_ttl, args.cache_max_size * 1024 * 1024
+        )
+    return PeridotClient(
+        timeout=args.timeout,
+        retries=args.retries,
+        backoff=args.backoff,
+        pool_size=max(args.concurrency, pool_size or 0),
+        token=args.token,
+        cache=cache,
+    )
+
+
+async def fetch_pages(
+    fetch_page, concurrency=DEFAULT_CONCURRENCY, start_page=0, executor=None
+):
+    # Yields (page, items) in page order until the first empty page.
+    # fetch_page is a blocking function returning the items of one page, up
+    # to `concurrency` pages ahead are requested in worker threads while the
+    # earlier ones are consumed.
+    loop = asyncio.get_running_loop()
+    pending = {}
+    next_page = start_page
+    try:
+        while True:
+            while len(pending) < concurrency:
+                pending[next_page] = loop.run_in_executor(
+                    executor, fetch_page, next_page
+                )
+                next_page += 1
+            page = min(pending)
+            items = await pending.pop(page)
+            if len(items) == 0:
+                return
+            yield page, items
+    finally:
+        for future in pending.values():
+            future.cancel()
+
+
+def iter_pages(fetch_page, concurrency=DEFAULT_CONCURRENCY, start_page=0):
+    # Synchronous wrapper around fetch_pages for the scripts. The pool is
+    # owned here so it can be shut down without starting new threads, even
+    # if the generator is only closed at interpreter exit.
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    loop = asyncio.new_event_loop()
+    pages = fetch_pages(fetch_page, concurrency, start_page, executor)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(pages.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(pages.aclose())
+        loop.close()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_items(fetch_page, concurrency=DEFAULT_CONCURRENCY):
+    for _, items in iter_pages(fetch_page, concurrency):
+        yield from items
+
+
+def fetch_all(fetch_page, concurrency=DEFAULT_CONCURRENCY):
+    return list(iter_items(fetch_page, concurrency))
+
+
+def iter_chunks(iterable, n):
+    # Like chunking a list, but consumes the iterable lazily
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+def batch_request(key, package_names):
+    return {key: [{"package_name": name} for name in package_names]}
+
+
+def write_json_lines(objects, f=sys.stdout):
+    # Flushed per line so consumers can start before the listing finishes
+    for obj in objects:
+        f.write(json.dumps(obj) + "\n")
+        f.flush()
@@ -29,39 +29,159 @@
 #  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 #  POSSIBILITY OF SUCH DAMAGE.
 
-import sys
-import requests
+import argparse
 import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-from common import build_batches_url
+from common import (
+    add_client_arguments,
+    batch_request,
+    build_batches_url,
+    client_from_args,
+    iter_chunks,
+    write_json_lines,
+)
+from checkpoint import (
+    add_checkpoint_arguments,
+    check_checkpoint_arguments,
+    iter_listing_items,
+)
 
 
-def get_batch(batch_type, task_id, status, page):
-    r = requests.get(build_batches_url(batch_type, task_id, page, status))
-    return r.json()[f"{batch_type}s"]
+def get_batch(client, batch_type, task_id, status, page):
+    r = client.get_json(build_batches_url(batch_type, task_id, page, status))
+    return r[f"{batch_type}s"]
 
 
-def process_batch(batch_type, task_id, status):
-    ret = []
-    page = 0
-    while True:
-        res = get_batch(batch_type, task_id, status, page)
-        if len(res) == 0:
-            return ret
-        ret.extend(res)
-        page = page + 1
+def iter_batch(client, args, batch_type, task_id, status, checkpoint_path=None):
+    return iter_listing_items(
+        args,
+        lambda page: get_batch(client, batch_type, task_id, status, page),
+        build_batches_url(batch_type, task_id, "{page}", status),
+        key=lambda item: item["name"],
+        checkpoint_path=checkpoint_path,
+    )
 
 
-if __name__ == "__main__":
-    batch_type = sys.argv[1]
-    task_id = sys.argv[2]
+def read_task_ids(task_ids):
+    # "-" or no ids at all reads whitespace separated ids from stdin
+    if not task_ids or "-" in task_ids:
+        task_ids = [task_id for task_id in task_ids if task_id != "-"]
+        task_ids.extend(sys.stdin.read().split())
+    return list(dict.fromkeys(task_ids))
+
+
+def iter_listing_names(client, args, batch_type, listings):
+    # A single listing streams as its pages arrive. Several listings are
+    # fetched args.jobs at a time through the shared client and come out in
+    # listing order.
+    if len(listings) == 1:
+        task_id, status = listings[0]
+        for item in iter_batch(client, args, batch_type, task_id, status):
+            yield item["name"]
+        return
+
+    if args.checkpoint:
+        os.makedirs(args.checkpoint, exist_ok=True)
 
-    batch_items = process_batch(batch_type, task_id, 4)
+    def fetch_names(listing):
+        task_id, status = listing
+        checkpoint_path = None
+        if args.checkpoint:
+            checkpoint_path = os.path.join(
+                args.checkpoint, f"{batch_type}-{task_id}-{status}.ndjson"
+            )
+        return [
+            item["name"]
+            for item in iter_batch(
+                client, args, batch_type, task_id, status, checkpoint_path
+            )
+        ]
 
-    req = {}
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        for names in executor.map(fetch_names, listings):
+            yield from names
+
+
+def iter_package_names(client, args, batch_type, listings):
+    seen = set()
+    for name in iter_listing_names(client, args, batch_type, listings):
+        if name not in seen:
+            seen.add(name)
+            yield name
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create a batch request from the failed items of batch tasks."
+    )
+    parser.add_argument("batch_type", type=str, help="build or import")
+    parser.add_argument(
+        "task_ids",
+        type=str,
+        nargs="*",
+        metavar="task_id",
+        help="Batch task ids, read from stdin if none or - is given",
+    )
+    parser.add_argument(
+        "--status",
+        type=int,
+        action="append",
+        default=None,
+        help="Item status to list, can be repeated (default: 4, failed)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help="Number of task listings fetched at once",
+    )
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="Print one package per line as pages arrive",
+    )
+    output.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Print batch requests of this size as pages arrive",
+    )
+    add_client_arguments(parser)
+    add_checkpoint_arguments(parser)
+    parser.epilog = (
+        "With more than one task id or status, --checkpoint is a directory "
+        "holding one checkpoint per listing."
+    )
+    args = parser.parse_args()
+    check_checkpoint_arguments(parser, args)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.chunk_size is not None and args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    batch_type = args.batch_type
     key = f"{batch_type}s"
-    req[key] = []
-    for item in batch_items:
-        req[key].append({"package_name": item["name"]})
+    statuses = list(dict.fromkeys(args.status or [4]))
+    listings = [
+        (task_id, status)
+        for task_id in read_task_ids(args.task_ids)
+        for status in statuses
+    ]
+    if not listings:
+        parser.error("no task ids given")
+
+    client = client_from_args(args, pool_size=args.concurrency * args.jobs)
+    package_names = iter_package_names(client, args, batch_type, listings)
 
-    print(json.dumps(req))
+    if args.ndjson:
+        write_json_lines({"package_name": name} for name in package_names)
+    elif args.chunk_size is not None:
+        write_json_lines(
+            batch_request(key, chunk)
+            for chunk in iter_chunks(package_names, args.chunk_size)
+        )
+    else:
+        print(json.dumps(batch_request(key, package_names)))
@@ -27,43 +27,140 @@
 #  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 #  POSSIBILITY OF SUCH DAMAGE.
 
+import argparse
 import sys
-import requests
-import json
 
-from itertools import islice
+from common import (
+    DEFAULT_CHUNK_SIZE,
+    add_client_arguments,
+    batch_request,
+    client_from_args,
+    construct_url,
+    iter_chunks,
+    iter_items,
+    write_json_lines,
+)
+from checkpoint import (
+    Checkpoint,
+    add_checkpoint_arguments,
+    check_checkpoint_arguments,
+    iter_unrecorded_items,
+)
+from submit import add_submit_arguments, report_submissions, submit_batches
 
-from common import construct_url
 
+def packages_url(page):
+    return construct_url(f"/packages?limit=100&page={page}&filters.no_builds=1")
 
-def chunks(lst, n):
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
 
+def get_packages(client, page):
+    return client.get_json(packages_url(page))["packages"]
+
+
+def batch_submit_url():
+    # BuildBatch endpoint of the Peridot API, takes the same body the
+    # printed requests have
+    return construct_url("/builds/batch")
+
+
+def open_checkpoint(args):
+    # Packages drop out of the no_builds listing once they get a build, so
+    # pages shift between runs and can't be resumed by number. The listing
+    # is read from the first page every time and --checkpoint records the
+    # package names that were printed or submitted, --incremental skips
+    # those.
+    if not args.checkpoint:
+        return None
+    checkpoint = Checkpoint(args.checkpoint, packages_url("{page}"))
+    if args.incremental:
+        checkpoint.load()
+    checkpoint.open()
+    return checkpoint
+
+
+def iter_package_chunks(client, args, checkpoint):
+    fetch_page = lambda page: get_packages(client, page)
+    if checkpoint is None:
+        items = iter_items(fetch_page, args.concurrency)
+    else:
+        items = iter_unrecorded_items(
+            fetch_page, checkpoint, args.concurrency, key=lambda item: item["name"]
+        )
+    return iter_chunks((item["name"] for item in items), args.chunk_size)
 
-def get_packages(page):
-    r = requests.get(
-        construct_url(f"/packages?limit=100&page={page}&filters.no_builds=1")
-    )
-    return r.json()["packages"]
 
+def record_written(chunks, checkpoint):
+    # A chunk is recorded when the next one is asked for, after it was
+    # written out
+    for chunk in chunks:
+        yield chunk
+        if checkpoint is not None:
+            checkpoint.record_items(chunk)
 
-def process_packages():
-    ret = []
-    page = 0
-    while True:
-        res = get_packages(page)
-        if len(res) == 0:
-            return ret
-        ret.extend(res)
-        page = page + 1
+
+def submit_chunks(client, args, chunks, checkpoint):
+    # Only chunks that were submitted successfully are recorded, failed ones
+    # are listed again by the next --incremental run
+    submitted = {}
+
+    def bodies():
+        for index, chunk in enumerate(chunks):
+            submitted[index] = chunk
+            yield batch_request("builds", chunk)
+
+    results = submit_batches(
+        client, batch_submit_url(), bodies(), args.max_in_flight, args.rate
+    )
+    for result in results:
+        chunk = submitted.pop(result["chunk"])
+        if checkpoint is not None and "error" not in result:
+            checkpoint.record_items(chunk)
+        yield result
 
 
 if __name__ == "__main__":
-    batch_items = process_packages()
+    parser = argparse.ArgumentParser(
+        description="Create build batch requests for packages without builds."
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="Print one package per line instead of batch requests",
+    )
+    add_client_arguments(parser)
+    add_checkpoint_arguments(parser, resume=False)
+    add_submit_arguments(parser)
+    args = parser.parse_args()
+    check_checkpoint_arguments(parser, args)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.max_in_flight < 1:
+        parser.error("--max-in-flight must be at least 1")
+    if args.submit and args.ndjson:
+        parser.error("--submit can't be used with --ndjson")
 
-    builds = []
-    for item in batch_items:
-        builds.append({"package_name": item["name"]})
-    for chunk in chunks(builds, 400):
-        print(json.dumps({"builds": chunk}))
+    client = client_from_args(args, pool_size=args.max_in_flight)
+    checkpoint = open_checkpoint(args)
+    try:
+        chunks = iter_package_chunks(client, args, checkpoint)
+        if args.submit:
+            results = submit_chunks(client, args, chunks, checkpoint)
+            failed = report_submissions(results)
+        elif args.ndjson:
+            write_json_lines(
+                {"package_name": name}
+                for chunk in record_written(chunks, checkpoint)
+                for name in chunk
+            )
+            failed = 0
+        else:
+            write_json_lines(
+                batch_request("builds", chunk)
+                for chunk in record_written(chunks, checkpoint)
+            )
+            failed = 0
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+    sys.exit(1 if failed else 0)
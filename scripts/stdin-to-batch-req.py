@@ -27,16 +27,30 @@
 #  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 #  POSSIBILITY OF SUCH DAMAGE.
 
+import argparse
 import sys
-import json
 
-if __name__ == "__main__":
-    build_type = sys.argv[1]
-    key = f"{build_type}s"
+from common import DEFAULT_CHUNK_SIZE, batch_request, iter_chunks, write_json_lines
+
+
+def read_package_names(f):
+    # Whole input at once, blank lines skipped, first occurrence kept
+    names = (line.strip() for line in f.read().splitlines())
+    return list(dict.fromkeys(name for name in names if name))
 
-    req = {}
-    req[key] = []
-    for line in sys.stdin:
-        req[key].append({"package_name": line.strip()})
 
-    print(json.dumps(req))
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create batch requests from package names read from stdin."
+    )
+    parser.add_argument("build_type", type=str, help="build or import")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    key = f"{args.build_type}s"
+
+    write_json_lines(
+        batch_request(key, chunk)
+        for chunk in iter_chunks(read_package_names(sys.stdin), args.chunk_size)
+    )
@@ -0,0 +1,135 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS 'AS IS'
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from common import write_json_lines
+
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+class RateLimiter:
+    # Spaces calls to wait() at least 1/rate seconds apart, no limit if rate
+    # is None
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.next_call = 0
+
+    def wait(self):
+        now = time.monotonic()
+        if self.next_call > now:
+            time.sleep(self.next_call - now)
+            now = self.next_call
+        self.next_call = now + self.interval
+
+
+def submit_batch(client, url, index, body):
+    # POSTs aren't retried by the client, a failed submission is reported
+    # instead of possibly being queued twice
+    packages = sum(len(value) for value in body.values())
+    result = {"chunk": index, "packages": packages}
+    start = time.monotonic()
+    try:
+        result["response"] = client.post_json(url, body)
+    except requests.RequestException as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.monotonic() - start, 3)
+    return result
+
+
+def submit_batches(client, url, bodies, max_in_flight=DEFAULT_MAX_IN_FLIGHT, rate=None):
+    # Yields one result per body in completion order. bodies is consumed
+    # lazily, so chunks are submitted while the listing is still being read,
+    # with at most max_in_flight requests outstanding.
+    limiter = RateLimiter(rate)
+    pending = set()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for index, body in enumerate(bodies):
+            while len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            limiter.wait()
+            pending.add(executor.submit(submit_batch, client, url, index, body))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def report_submissions(results, out=sys.stdout, summary=sys.stderr):
+    # Prints each result as a JSON line as it completes, then a summary.
+    # Returns the number of failed chunks.
+    seen = []
+
+    def collect():
+        for result in results:
+            seen.append(result)
+            yield result
+
+    write_json_lines(collect(), out)
+    failed = [result for result in seen if "error" in result]
+    latencies = sorted(result["seconds"] for result in seen)
+    summary.write(
+        f"Submitted {len(seen) - len(failed)}/{len(seen)} chunks, "
+        f"{sum(result['packages'] for result in seen)} packages"
+    )
+    if latencies:
+        summary.write(
+            f", latency median {latencies[len(latencies) // 2]}s "
+            f"max {latencies[-1]}s"
+        )
+    summary.write("\n")
+    for result in failed:
+        summary.write(f"Chunk {result['chunk']} failed: {result['error']}\n")
+    return len(failed)
+
+
+def add_submit_arguments(parser):
+    parser.add_argument(
+        "--submit",
+        action="store_true",
+        help="Submit the batch requests instead of printing them",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=DEFAULT_MAX_IN_FLIGHT,
+        help="Number of submissions running at once",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Maximum number of submissions started per second",
+    )
@@ -0,0 +1,333 @@
+#  -- peridot-releng-header-v0.1 --
+#  Copyright (c) Peridot-Releng Authors. All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are met:
+#
+#  1. Redistributions of source code must retain the above copyright notice,
+#  this list of conditions and the following disclaimer.
+#
+#  2. Redistributions in binary form must reproduce the above copyright notice,
+#  this list of conditions and the following disclaimer in the documentation
+#  and/or other materials provided with the distribution.
+#
+#  3. Neither the name of the copyright holder nor the names of its contributors
+#  may be used to endorse or promote products derived from this software without
+#  specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS 'AS IS'
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from cache import ResponseCache
+from checkpoint import Checkpoint, iter_checkpointed_items, iter_unrecorded_items
+from common import PeridotClient, batch_request, iter_pages
+from submit import report_submissions, submit_batches
+
+# The API is stood in for by a local server calling respond(request) for
+# every request, which returns (status, body, headers). Requests are
+# recorded as dicts with the method, path, query, headers and JSON body.
+
+
+@contextmanager
+def serve(respond):
+    seen = []
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def handle_request(self, method):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            request = {
+                "method": method,
+                "path": url.path,
+                "query": {k: v[0] for k, v in parse_qs(url.query).items()},
+                "headers": dict(self.headers),
+                "body": json.loads(self.rfile.read(length)) if length else None,
+            }
+            with lock:
+                seen.append(request)
+            status, body, headers = respond(request)
+            data = b"" if body is None else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.handle_request("GET")
+
+        def do_POST(self):
+            self.handle_request("POST")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}", seen
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def make_client(**kwargs):
+    kwargs.setdefault("retries", 3)
+    kwargs.setdefault("backoff", 0)
+    kwargs.setdefault("timeout", 5)
+    return PeridotClient(**kwargs)
+
+
+def paged(pages, delay=0):
+    # Serves pages[page] for /items?page=N, an empty page past the end. Early
+    # pages answer slowest, so they complete after the ones behind them.
+    def respond(request):
+        page = int(request["query"]["page"])
+        time.sleep(delay * max(0, len(pages) - page))
+        items = pages[page] if page < len(pages) else []
+        return 200, {"items": items}, {}
+
+    return respond
+
+
+def test_pages_are_yielded_in_order():
+    pages = [[f"p{page}-{i}" for i in range(3)] for page in range(6)]
+    client = make_client()
+    with serve(paged(pages, delay=0.01)) as (base, seen):
+
+        def fetch_page(page):
+            return client.get_json(f"{base}/items?page={page}")["items"]
+
+        assert list(iter_pages(fetch_page, concurrency=4)) == list(enumerate(pages))
+        assert list(iter_pages(fetch_page, concurrency=4, start_page=4)) == [
+            (4, pages[4]),
+            (5, pages[5]),
+        ]
+
+
+def test_listing_stops_at_first_empty_page():
+    pages = [["a"], ["b"], [], ["c"]]
+    fetched = []
+
+    def fetch_page(page):
+        fetched.append(page)
+        return pages[page] if page < len(pages) else []
+
+    assert list(iter_pages(fetch_page, concurrency=2)) == [(0, ["a"]), (1, ["b"])]
+    # No more than `concurrency` pages are requested past the empty one
+    assert max(fetched) <= 3
+
+
+def test_transient_errors_are_retried():
+    statuses = iter([429, 503, 502, 200])
+
+    def respond(request):
+        status = next(statuses)
+        if status == 429:
+            return status, {"error": "slow down"}, {"Retry-After": "0"}
+        return status, {"ok": status == 200}, {}
+
+    with serve(respond) as (base, seen):
+        assert make_client().get_json(f"{base}/status") == {"ok": True}
+    assert len(seen) == 4
+
+
+def test_retries_give_up():
+    with serve(lambda request: (503, {}, {})) as (base, seen):
+        with pytest.raises(requests.HTTPError):
+            make_client(retries=2).get_json(f"{base}/status")
+    assert len(seen) == 3
+
+
+def test_posts_are_not_retried():
+    with serve(lambda request: (503, {}, {})) as (base, seen):
+        with pytest.raises(requests.HTTPError):
+            make_client().post_json(f"{base}/batch", {"builds": []})
+    assert len(seen) == 1
+
+
+def test_resume(tmp_path):
+    pages = [[1, 2], [3, 4], [5, 6], [7]]
+    fetched = []
+
+    def fetch_page(page):
+        fetched.append(page)
+        return pages[page] if page < len(pages) else []
+
+    path = tmp_path / "checkpoint.ndjson"
+    items = iter_checkpointed_items(fetch_page, Checkpoint(path, "items"), 1)
+    assert [next(items) for _ in range(4)] == [1, 2, 3, 4]
+    items.close()
+    # A line cut short by a crash is dropped
+    with open(path, "a") as f:
+        f.write('{"page": 2, "ite')
+
+    fetched.clear()
+    checkpoint = Checkpoint(path, "items")
+    items = iter_checkpointed_items(fetch_page, checkpoint, 1, resume=True)
+    assert list(items) == [1, 2, 3, 4, 5, 6, 7]
+    assert min(fetched) == 2
+    assert checkpoint.done
+
+    fetched.clear()
+    items = iter_checkpointed_items(
+        fetch_page, Checkpoint(path, "items"), 1, resume=True
+    )
+    assert list(items) == [1, 2, 3, 4, 5, 6, 7]
+    assert fetched == []
+
+    with pytest.raises(ValueError):
+        Checkpoint(path, "other").load()
+
+
+def test_incremental(tmp_path):
+    pages = [[1, 2], [3]]
+    path = tmp_path / "checkpoint.ndjson"
+
+    def fetch_page(page):
+        return pages[page] if page < len(pages) else []
+
+    assert list(iter_checkpointed_items(fetch_page, Checkpoint(path, "items"))) == [
+        1,
+        2,
+        3,
+    ]
+    # The last page filled up and a new one was added since
+    pages = [[1, 2], [3, 4], [5]]
+    items = iter_checkpointed_items(
+        fetch_page, Checkpoint(path, "items"), incremental=True
+    )
+    assert list(items) == [4, 5]
+
+
+def test_unrecorded_items_of_a_shrinking_listing(tmp_path):
+    path = tmp_path / "checkpoint.ndjson"
+    checkpoint = Checkpoint(path, "packages")
+    checkpoint.open()
+    checkpoint.record_items(["a", "b"])
+    checkpoint.close()
+
+    # "a" got a build and left the listing, which moved "c" to the first page
+    pages = [[{"name": "b"}, {"name": "c"}], [{"name": "d"}]]
+    checkpoint = Checkpoint(path, "packages")
+    checkpoint.load()
+    items = iter_unrecorded_items(
+        lambda page: pages[page] if page < len(pages) else [],
+        checkpoint,
+        key=lambda item: item["name"],
+    )
+    assert [item["name"] for item in items] == ["c", "d"]
+    # Nothing is recorded until the caller handled the items
+    assert list(checkpoint.items()) == ["a", "b"]
+
+
+def test_cache_revalidates_with_etag(tmp_path):
+    version = {"n": 1}
+
+    def respond(request):
+        etag = f'"v{version["n"]}"'
+        if request["headers"].get("If-None-Match") == etag:
+            return 304, None, {"ETag": etag}
+        return 200, {"version": version["n"]}, {"ETag": etag}
+
+    with serve(respond) as (base, seen):
+        url = f"{base}/items?page=0"
+        cache = ResponseCache(str(tmp_path), ttl=60)
+        client = make_client(cache=cache)
+        assert client.get_json(url) == {"version": 1}
+        # Fresh entries are used without a request
+        assert client.get_json(url) == {"version": 1}
+        assert len(seen) == 1
+
+        cache.ttl = 0
+        assert client.get_json(url) == {"version": 1}
+        assert seen[-1]["headers"]["If-None-Match"] == '"v1"'
+        version["n"] = 2
+        assert client.get_json(url) == {"version": 2}
+        assert len(seen) == 3
+        assert cache.load(url)["etag"] == '"v2"'
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    urls = [f"http://peridot/items?page={page}" for page in range(4)]
+    for t, url in enumerate(urls[:3]):
+        cache.store(url, None, {"items": ["x" * 100]})
+        os.utime(cache.entry_path(url), (t, t))
+    cache.touch(urls[0])
+
+    # Room for three and a half entries, so storing a fourth evicts one
+    cache.max_size = cache.disk_size() * 7 // 6
+    cache.store(urls[3], None, {"items": ["x" * 100]})
+    assert cache.load(urls[1]) is None
+    assert all(cache.load(url) is not None for url in (urls[0], urls[2], urls[3]))
+    assert cache.size == cache.disk_size() <= cache.max_size
+
+
+def test_submit_reports_failed_chunks():
+    in_flight = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def respond(request):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        time.sleep(0.02)
+        with lock:
+            in_flight["now"] -= 1
+        names = [build["package_name"] for build in request["body"]["builds"]]
+        if "bad" in names:
+            return 500, {"error": "failed"}, {}
+        return 200, {"taskId": names[0]}, {}
+
+    chunks = [["a", "b"], ["bad"], ["c"], ["d", "e", "f"]]
+    with serve(respond) as (base, seen):
+        results = submit_batches(
+            make_client(),
+            f"{base}/builds/batch",
+            (batch_request("builds", chunk) for chunk in chunks),
+            max_in_flight=2,
+        )
+        out = io.StringIO()
+        summary = io.StringIO()
+        assert report_submissions(results, out, summary) == 1
+
+    # The failed POST isn't retried
+    assert len(seen) == 4
+    assert in_flight["max"] <= 2
+    results = {r["chunk"]: r for r in map(json.loads, out.getvalue().splitlines())}
+    assert sorted(results) == [0, 1, 2, 3]
+    assert "error" in results[1]
+    assert results[3]["response"] == {"taskId": "d"}
+    assert results[3]["packages"] == 3
+    assert "Submitted 3/4 chunks, 7 packages" in summary.getvalue()
+    assert "Chunk 1 failed" in summary.getvalue()